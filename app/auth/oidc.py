@@ -17,16 +17,43 @@ ALGS = ["RS256"]
 _jwks_cache = None
 _jwks_cached_at = 0
 
-async def _get_jwks():
+def _jwks_stale() -> bool:
+    return (not _jwks_cache) or (time.time() - _jwks_cached_at > 3600)
+
+def _store_jwks(jwks: dict) -> dict:
     global _jwks_cache, _jwks_cached_at
-    if (not _jwks_cache) or (time.time() - _jwks_cached_at > 3600):
+    _jwks_cache = jwks
+    _jwks_cached_at = time.time()
+    return _jwks_cache
+
+async def _get_jwks():
+    if _jwks_stale():
         async with httpx.AsyncClient(timeout=10) as client:
             r = await client.get(LINKEDIN_JWKS)
             r.raise_for_status()
-            _jwks_cache = r.json()
-            _jwks_cached_at = time.time()
+            _store_jwks(r.json())
     return _jwks_cache
 
+def _get_jwks_sync():
+    if _jwks_stale():
+        try:
+            with httpx.Client(timeout=10) as client:
+                r = client.get(LINKEDIN_JWKS)
+                r.raise_for_status()
+                _store_jwks(r.json())
+        except Exception:
+            # keep serving the last good key set if LinkedIn is briefly unreachable
+            if not _jwks_cache:
+                raise
+    return _jwks_cache
+
+def prefetch_jwks() -> None:
+    """Warm the JWKS cache (call at startup so the first request doesn't pay for the fetch)."""
+    try:
+        _get_jwks_sync()
+    except Exception as e:
+        print(f"[oidc] JWKS prefetch failed: {e}", flush=True)
+
 def _select_jwk_for_token(id_token: str, jwks: dict) -> dict:
     header = jwt.get_unverified_header(id_token)
     kid = header.get("kid")
@@ -55,6 +82,28 @@ async def decode_linkedin_id_token(
     Otherwise, requires iss to be one of LINKEDIN_ISS_ALLOWLIST.
     """
     jwks = await _get_jwks()
+    return _verify_with_jwks(id_token, jwks, audience, allow_expired, allow_issuer_any)
+
+def decode_linkedin_id_token_sync(
+    id_token: str,
+    audience: str | None = None,
+    allow_expired: bool = False,
+    allow_issuer_any: bool = False,
+) -> dict:
+    """
+    Same as decode_linkedin_id_token, for sync handlers: verification is CPU-only,
+    so there's no need to spin up an event loop per call.
+    """
+    jwks = _get_jwks_sync()
+    return _verify_with_jwks(id_token, jwks, audience, allow_expired, allow_issuer_any)
+
+def _verify_with_jwks(
+    id_token: str,
+    jwks: dict,
+    audience: str | None,
+    allow_expired: bool,
+    allow_issuer_any: bool,
+) -> dict:
     jwk = _select_jwk_for_token(id_token, jwks)
 
     opts = {
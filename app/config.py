@@ -17,5 +17,9 @@ class Settings:
     fernet_key: str = os.getenv("FERNET_KEY", "")
     # Toggle to enable dev-only endpoints (like callback_no_state). Default is False in prod.
     enable_dev_endpoints: bool = os.getenv("ENABLE_DEV_ENDPOINTS", "false").lower() in ("1", "true", "yes")
+    # LOG_LEVEL=DEBUG turns on the startup/per-request diagnostic prints.
+    debug_logging: bool = os.getenv("LOG_LEVEL", "INFO").upper() == "DEBUG"
+    # Largest image accepted by the multipart /linkedin/post/image/upload route (default 10 MB).
+    max_image_upload_bytes: int = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(10 * 1024 * 1024)))
 
 settings = Settings()
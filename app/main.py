@@ -1,8 +1,12 @@
 import os
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
+from app.config import settings
 from app.deps import init_db
+from app.auth.oidc import prefetch_jwks
 
 # Routers
 from app.routers import generate, content, storage, storage_pipeline, scheduler_api
@@ -10,16 +14,33 @@ from app.routers import auth_linkedin, linkedin_publish
 from app.routers import thoughtpost
 
 
-app = FastAPI(title="LinkedIn SaaS API", version="0.5.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # blocking setup (DB schema, JWKS fetch) runs off the event loop
+    await run_in_threadpool(init_db)
+    await run_in_threadpool(prefetch_jwks)
+    # shared HTTP clients are created per startup (on this loop) and closed on shutdown
+    await linkedin_publish.open_http_clients()
+    await thoughtpost.open_http_clients()
+    yield
+    await linkedin_publish.aclose_http_clients()
+    await thoughtpost.aclose_http_clients()
+
+
+app = FastAPI(title="LinkedIn SaaS API", version="0.5.0", lifespan=lifespan)
 
 # ---- Feature flag (default false) ----
 ENABLE_OAUTH_LOGIN = os.getenv("ENABLE_OAUTH_LOGIN", "false").lower() == "true"
 
 # ---- CORS (must be BEFORE routes mount) ----
 # IMPORTANT: use a single CORSMiddleware. Credentials allowed only when not wildcard.
-raw_origins = os.getenv("ALLOWED_ORIGINS", "*").strip()
-ALLOWED_ORIGINS = ["*"] if raw_origins == "*" else [o.strip() for o in raw_origins.split(",") if o.strip()]
-USE_CREDENTIALS = (ALLOWED_ORIGINS != ["*"])  # only true when you set a specific origin like https://tylerguilbault.github.io
+# Parsed once at import; the env value never changes for the life of the process.
+_raw_origins = os.getenv("ALLOWED_ORIGINS", "*").strip()
+# Order-preserving de-dupe; trailing slashes stripped since browsers never send them in Origin.
+ALLOWED_ORIGINS: tuple[str, ...] = ("*",) if _raw_origins == "*" else tuple(
+    dict.fromkeys(o.strip().rstrip("/") for o in _raw_origins.split(",") if o.strip().rstrip("/"))
+)
+USE_CREDENTIALS = (ALLOWED_ORIGINS != ("*",))  # only true when you set a specific origin like https://tylerguilbault.github.io
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,14 +60,11 @@ if ENABLE_OAUTH_LOGIN:
         https_only=True       # required for same_site="none"
     )
 
-print("CORS config ->", {"ALLOWED_ORIGINS": ALLOWED_ORIGINS, "allow_credentials": USE_CREDENTIALS})
-print("MOUNTING ROUTERS… main.py at runtime is:", __file__)
+if settings.debug_logging:
+    print("CORS config ->", {"ALLOWED_ORIGINS": ALLOWED_ORIGINS, "allow_credentials": USE_CREDENTIALS})
+    print("MOUNTING ROUTERS… main.py at runtime is:", __file__)
 
 
-@app.on_event("startup")
-def _startup():
-    init_db()
-
 @app.get("/")
 def root():
     return {"message": "LinkedIn SaaS API is running!"}
@@ -55,12 +73,16 @@ def root():
 def health():
     return {"ok": True}
 
-# Mount routes
-app.include_router(generate.router)           # /rss/*
-app.include_router(content.router)            # /generate/*
-app.include_router(storage.router)            # /storage/*
-app.include_router(storage_pipeline.router)   # /pipeline/*
-app.include_router(scheduler_api.router)      # /scheduler/*
-app.include_router(auth_linkedin.router)      # /auth/linkedin/*
-app.include_router(linkedin_publish.router)   # /linkedin/*
-app.include_router(thoughtpost.router)
+# Mount routes (each exactly once)
+_ROUTERS = (
+    generate.router,           # /rss/*
+    content.router,            # /generate/*
+    storage.router,            # /storage/*
+    storage_pipeline.router,   # /pipeline/*
+    scheduler_api.router,      # /scheduler/*
+    auth_linkedin.router,      # /auth/linkedin/*
+    linkedin_publish.router,   # /linkedin/*
+    thoughtpost.router,        # /generate/thoughtpost*
+)
+for _r in _ROUTERS:
+    app.include_router(_r)
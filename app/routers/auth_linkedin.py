@@ -13,14 +13,14 @@ import app.services.linkedin_api as linkedin_api
 from app.db import crud_tokens
 from app.db import token_crypto
 from app.db.models import User
+from app.routers import linkedin_publish
 
 ENABLE_OAUTH_LOGIN = os.getenv("ENABLE_OAUTH_LOGIN", "false").lower() == "true"
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://tylerguilbault.github.io/LinkedinSaaSfrontend")
 
 
 # NEW: decode helper
-from app.auth.oidc import decode_linkedin_id_token
-import anyio
+from app.auth.oidc import decode_linkedin_id_token_sync
 
 router = APIRouter(prefix="/auth/linkedin", tags=["linkedin-auth"])
 STATE_STORE: set[str] = set()
@@ -104,8 +104,11 @@ def callback(
         refresh_token_encrypted=refresh_token_enc,
         id_token_encrypted=id_token_enc,
     )
+    # linkedin_publish serves access tokens from a short-lived cache; drop the pre-login one
+    linkedin_publish._forget_access_token(user.id)
 
     # Persist member_id on users if we have one
+    # (only ever set when empty — linkedin_publish caches user_id -> member_id on that basis)
     if member_id:
         try:
             if not user.member_id:
@@ -163,7 +166,7 @@ def whoami(user_id: int = Query(...), db: Session = Depends(get_db)):
     if getattr(tok, "id_token_encrypted", None):
         try:
             id_token = token_crypto.decrypt_token(tok.id_token_encrypted)
-            decoded = anyio.run(lambda: decode_linkedin_id_token(id_token))
+            decoded = decode_linkedin_id_token_sync(id_token)
             token_sub = decoded.get("sub")
         except Exception:
             token_sub = None
@@ -1,16 +1,25 @@
 # app/routers/linkedin_publish.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, File, Form, UploadFile
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, Optional, Tuple, Union
 from sqlalchemy.orm import Session
+from app.config import settings
 from app.deps import get_db
 from app.db import crud_tokens
 from app.db import token_crypto
+from app.db.models import User
 from app.services import linkedin_api
-from app.auth.oidc import decode_linkedin_id_token
-import anyio
+from app.auth.oidc import decode_linkedin_id_token_sync
 import re
 import html
+import hashlib
+import base64
+import httpx
+import threading
+import time
+from datetime import datetime
+from contextlib import asynccontextmanager
 
 # --- ADDED: imports/env + Request for session-aware posting (gated) ---
 import os
@@ -20,6 +29,42 @@ ENABLE_OAUTH_LOGIN = os.getenv("ENABLE_OAUTH_LOGIN", "false").lower() == "true"
 
 router = APIRouter(prefix="/linkedin", tags=["linkedin"])
 
+# Shared client for /post/image downloads so keep-alive connections are reused across requests.
+# Opened by the app lifespan on every startup and closed on shutdown; None outside a lifespan.
+_IMG_CLIENT: Optional[httpx.AsyncClient] = None
+
+async def open_http_clients() -> None:
+    """Create the shared HTTP client(s) on the running loop; called from the app lifespan on startup."""
+    global _IMG_CLIENT
+    _IMG_CLIENT = httpx.AsyncClient(
+        timeout=60,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+
+async def aclose_http_clients() -> None:
+    """Close the shared HTTP client(s); called from the app lifespan on shutdown."""
+    global _IMG_CLIENT
+    client, _IMG_CLIENT = _IMG_CLIENT, None
+    if client is not None:
+        await client.aclose()
+
+@asynccontextmanager
+async def _img_client():
+    # no lifespan (e.g. a bare TestClient): use a short-lived client instead of a closed/foreign one
+    if _IMG_CLIENT is not None:
+        yield _IMG_CLIENT
+        return
+    async with httpx.AsyncClient(timeout=60) as c:
+        yield c
+
+# Compiled once at import; used by the text cleaners on every /linkedin/post* call
+# Single alternation: CP1252 control block, "Â…"/"Â " (NBSP), "â…"/"âœ" lead-ins, "ð…"/"ðŸ" emoji heads
+_MOJIBAKE_RE = re.compile(r"[\u0080-\u009F]|Â[\u0080-\u00BF ]|â[\u0080-\u00BF\u0153]|ð[\u0080-\u00BF\u0178]")
+_URL_RE = re.compile(r"https?://\S+")
+_NEWLINE_RE = re.compile(r"\r\n?")
+_TRAIL_WS_RE = re.compile(r"[^\S\n]+\n")   # whitespace (other than the newline) ending a line
+_MULTI_BLANK_RE = re.compile(r"\n{3,}")
+
 class PublishIn(BaseModel):
     user_id: int
     text: str
@@ -33,7 +78,7 @@ class LinkShareIn(BaseModel):
 
 class ImageShareIn(BaseModel):
     user_id: int
-    image_base64: Optional[str] = None
+    image_base64: Optional[str] = Field(default=None, description="Deprecated: prefer multipart POST /linkedin/post/image/upload")
     image_url: Optional[str] = None
     text: str = ""
     member_id: Optional[str] = None
@@ -49,20 +94,12 @@ class LinkedInPostRequest(BaseModel):
     text: str = Field(..., min_length=1)
     link: Optional[str] = Field(default=None, description="Optional article URL to attach")
 
-def _looks_like_mojibake(s: str) -> bool:
-    # Control range U+0080–U+009F and typical "â…" / "ð…" sequences
-    return bool(
-        re.search(r"[\u0080-\u009F]", s) or
-        re.search(r"[Ââ][\u0080-\u00BF]", s) or
-        re.search(r"ð[\u0080-\u00BF]", s)
-    )
-
 def _fix_mojibake_roundtrip(s: str) -> str:
     """
     Undo UTF-8 text that was mis-decoded as Latin-1/CP1252.
     'â' -> '’', 'â¢' -> '•', 'âœ…' -> '✅', 'ðŸ¤”' -> '🤔'.
     """
-    if not s:
+    if not s or s.isascii():
         return s
     for _ in range(2):
         try:
@@ -80,15 +117,9 @@ def _looks_like_mojibake(s: str) -> bool:
     Heuristic: return True if text contains common UTF-8→CP1252 garbage.
     Examples: â¢ (bullet), âœ… (check), ðŸ… (emoji head), stray Â NBSP, CP1252 ctrls.
     """
-    if not s:
-        return False
-    return bool(
-        re.search(r"[\u0080-\u009F]", s) or         # CP1252 control block
-        "Â " in s or                                # NBSP rendered as 'Â '
-        "â" in s or                                # many 'â' lead-ins (—, –, ', ", •)
-        "âœ" in s or                                # checkmark sequence
-        "ðŸ" in s                                   # emoji heads like ðŸ¤”
-    )
+    if not s or s.isascii():
+        return False  # pure ASCII can't carry mis-decoded UTF-8
+    return bool(_MOJIBAKE_RE.search(s))
 
 def _final_text_clean(raw: str) -> str:
     """
@@ -108,27 +139,59 @@ def _final_text_clean(raw: str) -> str:
             pass
 
     # Remove naked URLs (the preview handles them)
-    t = re.sub(r'https?://\S+', '', t)
+    t = _URL_RE.sub('', t)
 
     # Preserve bullets, emojis, and paragraph spacing
-    t = t.replace("\r\n", "\n").replace("\r", "\n")
-    lines = [ln.rstrip() for ln in t.split("\n")]
-
-    cleaned = []
-    blank = 0
-    for ln in lines:
-        if ln.strip() == "":
-            blank += 1
-            if blank <= 1:
-                cleaned.append("")  # keep single blank line
-        else:
-            blank = 0
-            cleaned.append(ln)
-    t = "\n".join(cleaned)
+    if "\r" in t:
+        t = _NEWLINE_RE.sub("\n", t)
+
+    # Right-trim each line, then keep at most one blank line in a row
+    t = _TRAIL_WS_RE.sub("\n", t)
+    t = _MULTI_BLANK_RE.sub("\n\n", t)
 
     # Trim but keep structure
     return t.strip()
 
+# Decoded id_token claims keyed by a digest of the token (claims are fixed for a given token,
+# and signature verification is the expensive part of every /linkedin/post* call).
+_ID_TOKEN_CACHE_MAX = 512
+_ID_TOKEN_CACHE: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+_ID_TOKEN_LOCK = threading.Lock()  # callers run in threadpool workers
+
+def _decode_cached(id_token: str) -> Tuple[Optional[str], Optional[str]]:
+    """Return (sub, iss) for a LinkedIn id_token, verifying it only the first time it's seen."""
+    key = hashlib.blake2b(id_token.encode(), digest_size=16).hexdigest()
+    with _ID_TOKEN_LOCK:
+        hit = _ID_TOKEN_CACHE.get(key)
+    if hit is not None:
+        return hit
+
+    # DEV-friendly: verify signature/issuer but ignore 'exp'
+    decoded = decode_linkedin_id_token_sync(id_token, allow_expired=True, allow_issuer_any=True)
+    claims = (decoded.get("sub"), decoded.get("iss"))
+
+    # verification stays outside the lock; only the check/evict/insert has to be atomic
+    with _ID_TOKEN_LOCK:
+        if key not in _ID_TOKEN_CACHE and len(_ID_TOKEN_CACHE) >= _ID_TOKEN_CACHE_MAX:
+            _ID_TOKEN_CACHE.pop(next(iter(_ID_TOKEN_CACHE)), None)  # drop the oldest entry
+        _ID_TOKEN_CACHE[key] = claims
+    return claims
+
+# user_id -> member_id; a member_id is never rebound once stored, so hits can skip the users query.
+_MEMBER_ID_CACHE: Dict[int, str] = {}
+_MEMBER_ID_LOCK = threading.Lock()
+
+def _stored_member_id(db: Session, user_id: int) -> Optional[str]:
+    cached = _MEMBER_ID_CACHE.get(user_id)
+    if cached:
+        return cached
+    user = db.get(User, user_id)
+    member_id = user.member_id if user and user.member_id else None
+    if member_id:
+        with _MEMBER_ID_LOCK:
+            _MEMBER_ID_CACHE[user_id] = member_id
+    return member_id
+
 def _resolve_author_from_token(db: Session, user_id: int, access_token: str, provided_member_id: Optional[str], context: str) -> str:
     tok = crud_tokens.get_latest_token(db, user_id=user_id)
     if not tok:
@@ -143,18 +206,14 @@ def _resolve_author_from_token(db: Session, user_id: int, access_token: str, pro
         raise HTTPException(401, "Failed to decrypt id_token; please re-login.")
 
     try:
-        # DEV-friendly: verify signature/issuer but ignore 'exp'
-        decoded = anyio.run(lambda: decode_linkedin_id_token(id_token, allow_expired=True, allow_issuer_any=True))
+        token_member_id, _ = _decode_cached(id_token)
     except Exception:
         raise HTTPException(401, "Could not decode id_token; please re-login.")
 
-    token_member_id = decoded.get("sub")
     if not token_member_id:
         raise HTTPException(401, "id_token missing 'sub'; please re-login.")
 
-    from app.db.models import User
-    user = db.query(User).filter(User.id == user_id).first()
-    db_member_id = user.member_id if user and user.member_id else None
+    db_member_id = _stored_member_id(db, user_id)
     if db_member_id and db_member_id != token_member_id:
         raise HTTPException(
             401,
@@ -163,10 +222,31 @@ def _resolve_author_from_token(db: Session, user_id: int, access_token: str, pro
         )
 
     author_urn = f"urn:li:person:{token_member_id}"
-    print(f"[{context}] author={author_urn} (source=id_token.sub)", flush=True)
+    if settings.debug_logging:
+        print(f"[{context}] author={author_urn} (source=id_token.sub)")
     return author_urn
 
+# user_id -> (plaintext access token, monotonic deadline). Saves the token query + decrypt per call;
+# entries expire before the token reaches the refresh window below, and are dropped on a LinkedIn 401.
+_ACCESS_TOKEN_TTL = 300
+_ACCESS_TOKEN_CACHE: Dict[int, Tuple[str, float]] = {}
+
+def _access_token_ttl(tok) -> float:
+    expires_at = getattr(tok, "expires_at", None)
+    if not isinstance(expires_at, datetime):
+        return _ACCESS_TOKEN_TTL
+    # stop serving from cache once is_token_expiring() would kick in, so refresh still happens
+    remaining = (expires_at - datetime.utcnow()).total_seconds() - 300
+    return max(0.0, min(_ACCESS_TOKEN_TTL, remaining))
+
+def _forget_access_token(user_id: int) -> None:
+    _ACCESS_TOKEN_CACHE.pop(user_id, None)
+
 def _get_fresh_access_token(db: Session, user_id: int) -> str:
+    cached = _ACCESS_TOKEN_CACHE.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
     tok = crud_tokens.get_latest_token(db, user_id=user_id)
     if not tok:
         raise HTTPException(400, "No LinkedIn token on file for this user_id. Visit /auth/linkedin/login first.")
@@ -176,8 +256,7 @@ def _get_fresh_access_token(db: Session, user_id: int) -> str:
         refresh_token_enc = crud_tokens.get_latest_refresh_token(db, user_id)
         if refresh_token_enc:
             try:
-                from app.db.token_crypto import decrypt_token as dec
-                plain_refresh = dec(refresh_token_enc)
+                plain_refresh = token_crypto.decrypt_token(refresh_token_enc)
                 resp = linkedin_api.exchange_refresh_for_token(plain_refresh)
                 access_token_new = resp.get("access_token")
                 expires_in_new = resp.get("expires_in", 3600)
@@ -189,7 +268,11 @@ def _get_fresh_access_token(db: Session, user_id: int) -> str:
             except Exception:
                 raise HTTPException(401, "LinkedIn token expired and refresh failed; please re-login.")
 
-    return token_crypto.decrypt_token(tok.access_token_encrypted)
+    access_token = token_crypto.decrypt_token(tok.access_token_encrypted)
+    ttl = _access_token_ttl(tok)
+    if ttl > 0:
+        _ACCESS_TOKEN_CACHE[user_id] = (access_token, time.monotonic() + ttl)
+    return access_token
 
 # --- ADDED: helper to resolve user_id via session when flag ON (fallback to body.user_id) ---
 def _resolve_user_id_from_session_or_body(request: Optional[Request], fallback_user_id: int) -> int:
@@ -209,7 +292,7 @@ def _resolve_user_id_from_session_or_body(request: Optional[Request], fallback_u
 # -------------------------------------------------------------------------------------------
 
 @router.post("/post")
-def publish(
+async def publish(
     body: PublishIn,
     db: Session = Depends(get_db),
     # --- ADDED: accept Request for session lookup (non-breaking) ---
@@ -218,12 +301,15 @@ def publish(
     # --- NEW: prefer session user when flag ON; else keep existing behavior ---
     effective_user_id = _resolve_user_id_from_session_or_body(request, body.user_id)
 
-    access_token = _get_fresh_access_token(db, effective_user_id)
-    author_urn = _resolve_author_from_token(db, effective_user_id, access_token, provided_member_id=None, context="post")
+    # token refresh / id_token checks hit the DB synchronously; keep them off the event loop
+    access_token = await run_in_threadpool(_get_fresh_access_token, db, effective_user_id)
+    author_urn = await run_in_threadpool(
+        _resolve_author_from_token, db, effective_user_id, access_token, provided_member_id=None, context="post"
+    )
 
     safe_text = _final_text_clean(body.text)
 
-    ok, ref = linkedin_api.post_text(access_token, author_urn, safe_text)
+    ok, ref = await linkedin_api.post_text_async(access_token, author_urn, safe_text)
     if ok:
         try:
             ref_text = getattr(ref, "text", ref)
@@ -234,22 +320,16 @@ def publish(
     status = getattr(ref, "status_code", None) or (ref.get("status") if isinstance(ref, dict) else None)
     message = getattr(ref, "text", None) or (ref.get("message") if isinstance(ref, dict) else str(ref))
     code = (ref.get("serviceErrorCode") if isinstance(ref, dict) else None)
-    raise HTTPException(status or 400, f"LinkedIn API error ({status}) [{code}]: {message}")
-
-
-    status = getattr(ref, "status_code", None) or (ref.get("status") if isinstance(ref, dict) else None)
-    message = getattr(ref, "text", None) or (ref.get("message") if isinstance(ref, dict) else str(ref))
-    code = (ref.get("serviceErrorCode") if isinstance(ref, dict) else None)
+    if status == 401:
+        _forget_access_token(effective_user_id)
     raise HTTPException(status or 400, f"LinkedIn API error ({status}) [{code}]: {message}")
 
 @router.get("/check")
 def check(user_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Dry-run: resolve access token, member_id/person_id and return the author URN the server would use."""
     access_token = _get_fresh_access_token(db, user_id)
-    from app.db.models import User
-
     # Look up stored DB values
-    user_db = db.query(User).filter(User.id == user_id).first()
+    user_db = db.get(User, user_id)
     db_member_id = user_db.member_id if user_db else None
     db_person_id = user_db.person_id if user_db else None
 
@@ -260,16 +340,17 @@ def check(user_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     if tok:
         enc = getattr(tok, "id_token_encrypted", None)
         plain = getattr(tok, "id_token", None)
-        if enc or plain:
+        if not enc and plain and settings.debug_logging:
+            # tokens are stored encrypted; a plaintext id_token means a legacy/out-of-band row
+            print(f"[check] warning: using plaintext id_token for user_id={user_id}", flush=True)
+        try:
             id_token = token_crypto.decrypt_token(enc) if enc else plain
-            try:
-                # DEV-friendly: verify signature/issuer but ignore 'exp'
-                decoded = anyio.run(lambda: decode_linkedin_id_token(id_token, allow_expired=True, allow_issuer_any=True))
-                token_sub = decoded.get("sub")
-                iss_claim = decoded.get("iss")
-            except Exception as e:
-                decode_error = str(e)
-                token_sub = None
+            if id_token:
+                # shares the per-token cache with _resolve_author_from_token
+                token_sub, _ = _decode_cached(id_token)
+        except Exception as e:
+            decode_error = str(e)
+            token_sub = None
     # Prefer DB member_id, else token_sub
     chosen_member = db_member_id or token_sub
 
@@ -293,7 +374,7 @@ def check(user_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     }
 
 @router.post("/post/link")
-def post_link(
+async def post_link(
     body: LinkShareIn,
     db: Session = Depends(get_db),
     # --- ADDED: accept Request for session lookup (non-breaking) ---
@@ -302,62 +383,136 @@ def post_link(
     # --- NEW: prefer session user when flag ON; else keep existing behavior ---
     effective_user_id = _resolve_user_id_from_session_or_body(request, body.user_id)
 
-    access_token = _get_fresh_access_token(db, effective_user_id)
-    author_urn = _resolve_author_from_token(db, effective_user_id, access_token, body.member_id, context="post_link")
+    # token refresh / id_token checks hit the DB synchronously; keep them off the event loop
+    access_token = await run_in_threadpool(_get_fresh_access_token, db, effective_user_id)
+    author_urn = await run_in_threadpool(
+        _resolve_author_from_token, db, effective_user_id, access_token, body.member_id, context="post_link"
+    )
 
     safe_text = _final_text_clean(body.text)
 
-    ok, resp = linkedin_api.post_article_share(access_token, author_urn, body.url, safe_text)
+    ok, resp = await linkedin_api.post_article_share_async(access_token, author_urn, body.url, safe_text)
     if ok:
         return {"status": "posted", "ref": resp.text}
+    if resp.status_code == 401:
+        _forget_access_token(effective_user_id)
     raise HTTPException(502, f"LinkedIn article share failed: {resp.text}")
 
+# Key of the upload mechanism in LinkedIn's registerUpload response
+_MEDIA_UPLOAD_KEY = "com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest"
+
+# Chunk size for streaming multipart uploads on to LinkedIn
+_UPLOAD_CHUNK = 65536
+
+class _UploadTooLarge(Exception):
+    pass
+
+async def _share_image(
+    access_token: str,
+    author_urn: str,
+    user_id: int,
+    image: Union[bytes, AsyncIterator[bytes]],
+    safe_text: str,
+    image_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    reg = await linkedin_api.register_image_upload_async(access_token, author_urn)
+    value = reg["value"]
+    upload_url = value["uploadMechanism"][_MEDIA_UPLOAD_KEY]["uploadUrl"]
+    asset_urn = value["asset"]
+
+    success = await linkedin_api.upload_image_asset_async(upload_url, image, content_length=image_size)
+    if not success:
+        raise HTTPException(502, "LinkedIn image upload failed.")
+
+    ok, resp = await linkedin_api.post_image_share_async(access_token, author_urn, asset_urn, safe_text)
+    if ok:
+        return {"status": "posted", "ref": resp.text}
+    if resp.status_code == 401:
+        _forget_access_token(user_id)
+    raise HTTPException(502, f"LinkedIn image share failed: {resp.text}")
+
 @router.post("/post/image")
-def post_image(
+async def post_image(
     body: ImageShareIn,
     db: Session = Depends(get_db),
     # --- ADDED: accept Request for session lookup (non-breaking) ---
     request: Request = None
 ) -> Dict[str, Any]:
-    import base64, httpx
     # --- NEW: prefer session user when flag ON; else keep existing behavior ---
     effective_user_id = _resolve_user_id_from_session_or_body(request, body.user_id)
 
-    access_token = _get_fresh_access_token(db, effective_user_id)
-    author_urn = _resolve_author_from_token(db, effective_user_id, access_token, body.member_id, context="post_image")
+    # token refresh / id_token checks hit the DB synchronously; keep them off the event loop
+    access_token = await run_in_threadpool(_get_fresh_access_token, db, effective_user_id)
+    author_urn = await run_in_threadpool(
+        _resolve_author_from_token, db, effective_user_id, access_token, body.member_id, context="post_image"
+    )
 
     safe_text = _final_text_clean(body.text)
 
-    reg = linkedin_api.register_image_upload(access_token, author_urn)
-    upload_url = reg["value"]["uploadMechanism"]["com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest"]["uploadUrl"]
-    asset_urn = reg["value"]["asset"]
-
     if body.image_base64:
         image_bytes = base64.b64decode(body.image_base64)
     elif body.image_url:
-        with httpx.Client(timeout=60) as c:
-            r = c.get(body.image_url)
-            r.raise_for_status()
-            image_bytes = r.content
+        async with _img_client() as c:
+            r = await c.get(body.image_url)
+        r.raise_for_status()
+        image_bytes = r.content
     else:
         raise HTTPException(400, "Provide image_base64 or image_url.")
 
-    success = linkedin_api.upload_image_asset(upload_url, image_bytes)
-    if not success:
-        raise HTTPException(502, "LinkedIn image upload failed.")
+    return await _share_image(access_token, author_urn, effective_user_id, image_bytes, safe_text)
 
-    ok, resp = linkedin_api.post_image_share(access_token, author_urn, asset_urn, safe_text)
-    if ok:
-        return {"status": "posted", "ref": resp.text}
-    raise HTTPException(502, f"LinkedIn image share failed: {resp.text}")
+@router.post("/post/image/upload")
+async def post_image_upload(
+    image: UploadFile = File(...),
+    user_id: int = Form(...),
+    text: str = Form(""),
+    member_id: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    request: Request = None
+) -> Dict[str, Any]:
+    """Multipart variant of /post/image: the file is spooled by the server instead of arriving as base64 JSON."""
+    effective_user_id = _resolve_user_id_from_session_or_body(request, user_id)
+
+    access_token = await run_in_threadpool(_get_fresh_access_token, db, effective_user_id)
+    author_urn = await run_in_threadpool(
+        _resolve_author_from_token, db, effective_user_id, access_token, member_id, context="post_image_upload"
+    )
+
+    limit = settings.max_image_upload_bytes
+    if image.size is not None:
+        if image.size == 0:
+            raise HTTPException(400, "Uploaded image is empty.")
+        if image.size > limit:
+            raise HTTPException(413, f"Uploaded image exceeds {limit} bytes.")
+    else:
+        # size unknown: peek one chunk so an empty upload is still rejected before registerUpload
+        first = await image.read(_UPLOAD_CHUNK)
+        if not first:
+            raise HTTPException(400, "Uploaded image is empty.")
+        await image.seek(0)
+
+    safe_text = _final_text_clean(text)
+
+    async def _chunks() -> AsyncIterator[bytes]:
+        # hand LinkedIn the spooled file 64 KB at a time instead of one whole-image bytes object
+        sent = 0
+        while chunk := await image.read(_UPLOAD_CHUNK):
+            sent += len(chunk)
+            if sent > limit:
+                raise _UploadTooLarge()
+            yield chunk
+
+    try:
+        return await _share_image(access_token, author_urn, effective_user_id, _chunks(), safe_text, image.size)
+    except _UploadTooLarge:
+        raise HTTPException(413, f"Uploaded image exceeds {limit} bytes.")
 
 @router.post("/debug/post")
 def debug_post(body: DebugPostIn, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Dev-only: attempt a post using the provided member_id or person_id (no persistence) and return raw response for debugging."""
     access_token = _get_fresh_access_token(db, body.user_id)
 
-    from app.db.models import User
-    user_db = db.query(User).filter(User.id == body.user_id).first()
+    user_db = db.get(User, body.user_id)
     db_member_id = user_db.member_id if user_db else None
 
     chosen_person = body.person_id
@@ -1,12 +1,14 @@
 ﻿from fastapi import APIRouter
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any
 from app.services.scheduler import run_once
 
+# apscheduler is only needed once someone starts the scheduler; keep it off the import path
+if TYPE_CHECKING:
+    from apscheduler.schedulers.background import BackgroundScheduler
+
 router = APIRouter(prefix="/scheduler", tags=["scheduler"])
 
-scheduler: Optional[BackgroundScheduler] = None
+scheduler: Optional["BackgroundScheduler"] = None
 
 @router.post("/run")
 def run_now() -> Dict[str, Any]:
@@ -19,6 +21,9 @@ def start(cron: str = "0 9 * * *") -> Dict[str, Any]:
     if scheduler and scheduler.running:
         return {"status": "already-running"}
 
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
     scheduler = BackgroundScheduler(timezone="UTC")
     trigger = CronTrigger.from_crontab(cron)
     scheduler.add_job(run_once, trigger, id="daily_post", replace_existing=True, max_instances=1, coalesce=True)
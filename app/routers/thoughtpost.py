@@ -1,13 +1,35 @@
 # app/routers/thoughtpost.py
 from __future__ import annotations
-from typing import Optional, Dict, Any, List
-from fastapi import APIRouter
+from typing import Optional, Dict, Any, List, Tuple
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-import os, re, html, httpx, hashlib
-from openai import AsyncOpenAI
-
-# ✅ create the client once at module load
-oai_client = AsyncOpenAI()  # will read OPENAI_API_KEY from env
+import os, re, html, json, httpx, hashlib, asyncio, time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, NotFoundError
+
+# Optional DFA engine for the hot, backtracking-free scans (URL strip, topic keywords)
+try:
+    import re2 as _re_fast  # pip install google-re2
+except ImportError:
+    _re_fast = re
+
+try:
+    import orjson  # optional: faster request-body serialization
+except ImportError:
+    orjson = None
+
+try:
+    import ftfy  # optional: better mojibake repair than the Latin-1 round-trip
+    ftfy.fix_encoding("\u00e2\u0080\u0099")  # warm its lookup tables at import, not on the first draft
+except ImportError:
+    ftfy = None
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 router = APIRouter(prefix="/generate", tags=["generate"])
 
@@ -25,37 +47,107 @@ REWRITER_MODELS: List[str] = [m.strip() for m in _raw_models.split(",") if m.str
 HF_TIMEOUT = float(os.getenv("HF_TIMEOUT", "60"))
 HF_API_BASE = "https://api-inference.huggingface.co/models/"
 
-class ThoughtPostRequest(BaseModel):
-    text: str = Field(..., min_length=1)
-    tone: str = Field(default="professional")
-    angle: Optional[str] = Field(default=None, description="e.g., career | leadership | market | hiring | ops")
-    max_words: int = Field(default=230, ge=80, le=300)
-    source_title: Optional[str] = None
-    source_link: Optional[str] = None
+# Shared clients, shared across calls (and across the per-model HF fallback loop) so TLS connections
+# are reused. Opened by the app lifespan on every startup and closed on shutdown; outside a lifespan
+# (e.g. a bare TestClient) the accessors below fall back to a short-lived client per call.
+_CLIENTS: Dict[str, Any] = {}
 
-class ThoughtPostResponse(BaseModel):
-    draft: str
+async def open_http_clients() -> None:
+    """Create the shared clients on the running loop; called from the app lifespan on startup."""
+    _CLIENTS["hf"] = httpx.AsyncClient(
+        timeout=HF_TIMEOUT,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    )
+    try:
+        # a roomier pool than the SDK default so concurrent drafts don't queue on connections
+        _CLIENTS["oai"] = AsyncOpenAI(  # will read OPENAI_API_KEY from env
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=512, max_keepalive_connections=64),
+            ),
+        )
+    except Exception as e:
+        # e.g. no OPENAI_API_KEY: OpenAI calls then fail per request and fall back to HF
+        print(f"[openai.init.error] {e}", flush=True)
+
+async def aclose_http_clients() -> None:
+    """Close the shared clients; called from the app lifespan on shutdown."""
+    hf, oai = _CLIENTS.pop("hf", None), _CLIENTS.pop("oai", None)
+    if hf is not None:
+        await hf.aclose()
+    if oai is not None:
+        await oai.close()
+
+@asynccontextmanager
+async def _hf_client():
+    c = _CLIENTS.get("hf")
+    if c is not None:
+        yield c
+        return
+    async with httpx.AsyncClient(timeout=HF_TIMEOUT) as c:
+        yield c
+
+@asynccontextmanager
+async def _oai_client():
+    c = _CLIENTS.get("oai")
+    if c is not None:
+        yield c
+        return
+    async with AsyncOpenAI() as c:
+        yield c
+
+# --- Cleanup patterns (compiled once; the cleanup path runs on every generated draft) ---
+# Cheap probe: C1 controls or a common mojibake lead char (Â Ã â ð). No hit => nothing to repair.
+_SUSPECT       = re.compile(r"[\u0080-\u009F\u00C2\u00C3\u00E2\u00F0]").search
+_RE_MOJIBAKE   = re.compile(r"[\u0080-\u009F]|[Ââ][\u0080-\u00BF]|ð[\u0080-\u00BF]")
+# C0 controls (except \t \n \r) + DEL, deleted via str.translate instead of a regex pass
+_CTRL_TABLE    = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+_RE_ELLIPSIS   = re.compile(r"\s*\.\s*\.\s*\.?\s*")
+_RE_URL        = _re_fast.compile(r"https?://\S+")
+_RE_BLANKLINES = re.compile(r"\n{3,}")
+# One scan for the inline rewrites in _normalize_linkedin_markup; dispatched on m.lastgroup
+_RE_INLINE     = re.compile(
+    r"(?P<url>https?://\S+)"
+    r"|\*\*(?P<bold>.*?)\*\*"
+    r"|\*(?P<italic>.*?)\*"
+    r"|_(?P<under>.*?)_"
+    r"|(?P<tag>(?i:\bhashtag\s*#?(?P<tagname>\w+)))"
+)
+_RE_NUMLIST    = re.compile(r"^[^\S\n]*\d+\.[^\S\n]+", re.M)
+_RE_WS_RUN     = re.compile(r"[ \t]{2,}")  # inline runs only; newlines are handled per line
+_RE_WS         = re.compile(r"\s+")
+# Anything _cleanup would change beyond an outer strip: non-ASCII / control / tab / CR, a blank-line
+# run, whitespace at a line edge, dot pairs (_RE_ELLIPSIS), URLs, entities. No hit => strip and go.
+_RE_NEEDS_CLEANUP = re.compile(r"[^\x20-\x7E\n]|\n\n\n| \n|\n |\.\s*\.|http|&")
+_FIRST_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
 
 class ThoughtPostRequest(BaseModel):
     text: str = Field(..., min_length=1)
     tone: str = Field(default="professional")
-    angle: Optional[str] = Field(default=None)   # removed invalid "..."
+    angle: Optional[str] = Field(default=None, description="e.g., career | leadership | market | hiring | ops")
     max_words: int = Field(default=230, ge=80, le=300)
     source_title: Optional[str] = None
     source_link: Optional[str] = None
 
     use_emojis: bool = Field(default=False, description="If true, include 3 emojis in the post")
 
+class ThoughtPostResponse(BaseModel):
+    draft: str
+
 # --- add this helper near the top of the file (e.g., under imports) ---
 def _fix_mojibake_roundtrip(s: str) -> str:
     """
     Fix UTF-8 text that was incorrectly decoded as CP1252/Latin-1.
     Example: 'â¢' -> '•', 'âœ…' -> '✅', 'ðŸ¤”' -> '🤔'.
-    We try up to two passes in case it was mangled twice.
+    Uses ftfy when installed; otherwise we try up to two Latin-1 round-trip passes in case it
+    was mangled twice. Either way nothing runs unless the text trips _SUSPECT, so clean text
+    never pays for an encode/decode.
     """
-    if not s:
-        return s
+    if ftfy is not None:
+        # fix_encoding only undoes mis-decoding (no quote/ligature/entity rewrites like fix_text)
+        return ftfy.fix_encoding(s) if s and _SUSPECT(s) else s
     for _ in range(2):
+        if not s or not _SUSPECT(s):
+            break
         try:
             s2 = s.encode("latin1", errors="ignore").decode("utf-8", errors="ignore")
         except Exception:
@@ -89,67 +181,58 @@ FEW_SHOTS: List[str] = [
     ),
 ]
 
+# The wording the prompt has always used; the dict is built once instead of per request
 _ANGLE_HINT = {
-    "career":    "Translate to skills, portability, and compounding learning.",
-    "leadership":"Prioritization, communication, and explicit tradeoffs.",
-    "market":    "Competitive dynamics, capital access, and switching costs.",
-    "hiring":    "Signals in interviews, ramp speed, real tools used.",
-    "ops":       "Runbooks, SLAs, handoffs, and failure modes.",
+    "career":     "Translate to skills and compounding learning.",
+    "leadership": "Prioritization, communication, and explicit tradeoffs.",
+    "market":     "Competitive dynamics and switching costs.",
+    "hiring":     "Signals in interviews and ramp speed.",
+    "ops":        "Runbooks, SLAs, handoffs, and failure modes.",
 }
+_ANGLE_HINT_DEFAULT = "Relate it to professional practice and peer learning."
+
+# Both term kinds in one scan; the case-insensitive keyword branch goes first so multi-word
+# keywords ("Supply chain") aren't swallowed by the capitalized-word branch
+_RE_TERMS = re.compile(
+    r"(?P<common>(?i:\b(?:ai|copilot|policy|loan|equity|funding|pricing|roadmap|security|privacy"
+    r"|compliance|supply chain|hybrid|erev|valuation)\b))"
+    r"|(?P<cap>\b[A-Z][A-Za-z0-9\-]{2,}\b)"
+)
 
 def _extract_terms(title: Optional[str], text: str) -> List[str]:
     raw = " ".join([title or "", text or ""])
-    caps = re.findall(r"\b[A-Z][A-Za-z0-9\-]{2,}\b", raw)
-    common = re.findall(
-        r"\b(ai|copilot|policy|loan|equity|funding|pricing|roadmap|security|privacy|compliance|supply chain|hybrid|erev|valuation)\b",
-        raw, flags=re.I,
-    )
-    pool = list(dict.fromkeys([*caps, *[c.title() for c in common]]))
+    caps: List[str] = []
+    common: List[str] = []
+    for m in _RE_TERMS.finditer(raw):
+        if m.lastgroup == "cap":
+            caps.append(m.group())
+        else:
+            common.append(m.group().title())
+    pool = list(dict.fromkeys([*caps, *common]))
     return pool[:8]
 
-def _detect_topics(text: str) -> List[str]:
-    t = text.lower()
-    tags: List[str] = []
-    if any(k in t for k in ["ai", "model", "llm", "copilot", "anthropic", "openai"]): tags.append("#AI")
-    if any(k in t for k in ["supply chain", "logistics", "manufacturing"]):           tags.append("#SupplyChain")
-    if any(k in t for k in ["finance", "loan", "equity", "valuation", "funding"]):    tags.append("#Finance")
-    if any(k in t for k in ["policy", "regulation", "administration", "trade"]):      tags.append("#Policy")
-    if any(k in t for k in ["product", "roadmap", "launch", "feature"]):              tags.append("#Product")
-    if any(k in t for k in ["hiring", "recruit", "talent"]):                          tags.append("#Hiring")
-    if any(k in t for k in ["ops", "oncall", "runbook", "incident", "sla"]):          tags.append("#Operations")
-    return tags
-
+# keyword -> tag; tags are emitted in this (category) order
+_TOPIC_KEYWORDS: Dict[str, List[str]] = {
+    "#AI":          ["ai", "model", "llm", "copilot", "anthropic", "openai"],
+    "#SupplyChain": ["supply chain", "logistics", "manufacturing"],
+    "#Finance":     ["finance", "loan", "equity", "valuation", "funding"],
+    "#Policy":      ["policy", "regulation", "administration", "trade"],
+    "#Product":     ["product", "roadmap", "launch", "feature"],
+    "#Hiring":      ["hiring", "recruit", "talent"],
+    "#Operations":  ["ops", "oncall", "runbook", "incident", "sla"],
+}
+_KEYWORD_TO_TAG: Dict[str, str] = {k: tag for tag, kws in _TOPIC_KEYWORDS.items() for k in kws}
+# whole words only (plus a plural "s"), so "said" isn't #AI and "stops" isn't #Operations
+_RE_TOPIC_KEYWORDS = _re_fast.compile(
+    r"(?i)\b(" + "|".join(re.escape(k) for k in sorted(_KEYWORD_TO_TAG, key=len, reverse=True)) + r")s?\b"
+)
 
-from typing import Optional  # keep this at the top of the file
+def _detect_topics(text: str) -> List[str]:
+    found = {_KEYWORD_TO_TAG[m.group(1).lower()] for m in _RE_TOPIC_KEYWORDS.finditer(text)}
+    return [tag for tag in _TOPIC_KEYWORDS if tag in found]
 
-from typing import Optional
 
-def _build_prompt(
-    text: str,
-    tone: str,
-    angle: Optional[str],
-    max_words: int,
-    source_title: Optional[str],
-    source_link: Optional[str],
-    use_emojis: bool
-) -> str:
-    angle_key = (angle or "").strip().lower()
-    angle_hint = {
-        "career":     "Translate to skills and compounding learning.",
-        "leadership": "Prioritization, communication, and explicit tradeoffs.",
-        "market":     "Competitive dynamics and switching costs.",
-        "hiring":     "Signals in interviews and ramp speed.",
-        "ops":        "Runbooks, SLAs, handoffs, and failure modes.",
-    }.get(angle_key, "Relate it to professional practice and peer learning.")
-
-    src_title = (source_title or "").strip()
-
-    # Emoji hint
-    emoji_hint = ""
-    if use_emojis:
-        emoji_hint = "Include exactly 3 tasteful emojis: one in each bullet + one elsewhere naturally."
-
-    prompt = f"""
+_PROMPT_TEMPLATE = """
 You are a seasoned LinkedIn thought leader. Write a natural, engaging post for professionals based on the ARTICLE below. Use exactly 2 bullet points (•). If use_emojis is true, **you must include exactly 3 emojis total: one emoji inside each bullet point, and one emoji in the reflective question. Do not omit those emojis**.
 
 ARTICLE:
@@ -162,26 +245,119 @@ Write it like a human:
 - Add 1–4 tasteful hashtags at the end (#Leadership etc.), not “hashtag#”.
 - Do NOT include any URLs (the system attaches the link preview).
 - Hit exactly {max_words} words or within 2-3 words of that value.
-- Tone: {tone}. Angle: {angle_key or "general"} — {angle_hint}
+- Tone: {tone}. Angle: {angle_key} — {angle_hint}
 
 Return only the post body exactly as it should appear.
 """.strip()
-    return prompt
+
+def _build_prompt(
+    text: str,
+    tone: str,
+    angle: Optional[str],
+    max_words: int,
+    source_title: Optional[str],
+    source_link: Optional[str],
+    use_emojis: bool
+) -> str:
+    angle_key = (angle or "").strip().lower()
+    return _PROMPT_TEMPLATE.format_map({
+        "src_title": (source_title or "").strip(),
+        "text": text,
+        "max_words": max_words,
+        "tone": tone,
+        "angle_key": angle_key or "general",
+        "angle_hint": _ANGLE_HINT.get(angle_key, _ANGLE_HINT_DEFAULT),
+    })
 
 
 # ---------- OpenAI primary ----------
-async def _call_openai(prompt: str) -> str:
-    resp = await oai_client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": "You are a professional LinkedIn content strategist."},
+OPENAI_SYSTEM_PROMPT = "You are a professional LinkedIn content strategist."
+OPENAI_TEMPERATURE = 0.4
+
+# Completed drafts keyed by a digest of (model, temperature, system, prompt). Identical requests
+# within the TTL (preview/re-render loops) skip the upstream call; OAI_CACHE_TTL=0 disables it.
+OAI_CACHE_TTL = float(os.getenv("OAI_CACHE_TTL", "3600"))
+_OAI_CACHE_MAX = 1024
+_OAI_CACHE: Dict[bytes, Tuple[str, float]] = {}  # key -> (draft, monotonic deadline)
+_OAI_INFLIGHT: Dict[bytes, "asyncio.Task[str]"] = {}  # single-flight: concurrent twins share one request
+_OAI_WAITERS: Dict["asyncio.Task[str]", int] = {}  # callers still awaiting each in-flight task
+
+def _oai_cache_key(prompt: str) -> bytes:
+    raw = f"{OPENAI_MODEL}|{OPENAI_TEMPERATURE}|{OPENAI_SYSTEM_PROMPT}|{prompt}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+def _oai_remember(key: bytes, task: "asyncio.Task[str]") -> None:
+    # runs once per upstream call, so health is tracked here even if every caller has gone
+    if _OAI_INFLIGHT.get(key) is task:
+        del _OAI_INFLIGHT[key]
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        _oai_mark(False)
+        return
+    _oai_mark(True)
+    _oai_store(key, task.result())
+
+def _oai_store(key: bytes, out: str) -> None:
+    if not out or OAI_CACHE_TTL <= 0:
+        return
+    if len(_OAI_CACHE) >= _OAI_CACHE_MAX:
+        _OAI_CACHE.pop(next(iter(_OAI_CACHE)), None)  # drop the oldest entry
+    _OAI_CACHE[key] = (out, time.monotonic() + OAI_CACHE_TTL)
+
+def _oai_body(prompt: str) -> Dict[str, Any]:
+    """Chat-completion request body; shared by the direct, streamed and Batch API paths."""
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
-        temperature=0.4,
-        max_tokens=1000
-    )
+        "temperature": OPENAI_TEMPERATURE,
+        "max_tokens": 1000,
+    }
+
+# Wall time of recent successful upstream completions (cache hits excluded); feeds _hedge_delay()
+_OAI_LATENCIES: "deque[float]" = deque(maxlen=200)
+
+async def _openai_complete(prompt: str) -> str:
+    started = time.monotonic()
+    async with _oai_client() as c:
+        resp = await c.chat.completions.create(**_oai_body(prompt))
+    _OAI_LATENCIES.append(time.monotonic() - started)
     return (resp.choices[0].message.content or "").strip()
-    
+
+async def _openai_stream(client: AsyncOpenAI, prompt: str):
+    """Open a streamed completion; awaiting this raises before any byte is sent to the client."""
+    return await client.chat.completions.create(**_oai_body(prompt), stream=True)
+
+async def _call_openai(prompt: str) -> str:
+    key = _oai_cache_key(prompt)
+    hit = _OAI_CACHE.get(key)
+    if hit and hit[1] > time.monotonic():
+        return hit[0]
+
+    task = _OAI_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_openai_complete(prompt))
+        _OAI_INFLIGHT[key] = task
+        task.add_done_callback(lambda t, k=key: _oai_remember(k, t))
+    _OAI_WAITERS[task] = _OAI_WAITERS.get(task, 0) + 1
+    try:
+        # shield: one caller leaving must not cancel the request others are waiting on...
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # ...but once the last one has (lost hedge, disconnect) stop the upstream call too
+        if _OAI_WAITERS.get(task) == 1 and not task.done():
+            if _OAI_INFLIGHT.get(key) is task:
+                del _OAI_INFLIGHT[key]
+            task.cancel()
+        raise
+    finally:
+        left = _OAI_WAITERS.pop(task, 1) - 1
+        if left:
+            _OAI_WAITERS[task] = left
+
 
 # ---------- HF fallback ----------
 async def _hf_generate_one(model: str, prompt: str) -> str:
@@ -195,12 +371,14 @@ async def _hf_generate_one(model: str, prompt: str) -> str:
             "return_full_text": False,
         }
     }
-    async with httpx.AsyncClient(timeout=HF_TIMEOUT) as client:
-        r = await client.post(url, headers=_hf_headers(), json=payload)
+    # serialized once (and reused by the retry); _hf_headers() sets the JSON Content-Type
+    body = _dumps(payload)
+    async with _hf_client() as c:
+        r = await c.post(url, headers=_hf_headers(), content=body)
         if r.status_code in (502,503,504,503):
-            r = await client.post(url, headers=_hf_headers(), json=payload)
-        r.raise_for_status()
-        data = r.json()
+            r = await c.post(url, headers=_hf_headers(), content=body)
+    r.raise_for_status()
+    data = r.json()
     if isinstance(data, list) and data:
         item = data[0]
         if isinstance(item, dict):
@@ -230,6 +408,69 @@ async def _hf_generate(models: List[str], prompt: str) -> str:
         raise last_err
     return ""
 
+# ---------- Hedged primary/fallback ----------
+# HF is started only once OpenAI has run past its own p95 latency (measured over recent upstream
+# calls), so a normal completion never triggers a second provider; whichever then returns a draft
+# first wins and the other is cancelled. Until enough samples exist the delay is HEDGE_DELAY
+# (default 10s, above a typical 1000-token completion); setting HEDGE_DELAY pins it.
+# After OAI_FAIL_THRESHOLD consecutive OpenAI errors the provider is skipped for OAI_COOLDOWN
+# seconds so requests don't pay for a doomed attempt.
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "10.0"))
+HEDGE_ADAPTIVE = "HEDGE_DELAY" not in os.environ
+_HEDGE_MIN_SAMPLES = 20
+OAI_FAIL_THRESHOLD = int(os.getenv("OAI_FAIL_THRESHOLD", "3"))
+OAI_COOLDOWN = float(os.getenv("OAI_COOLDOWN", "60"))
+_oai_health: Dict[str, float] = {"fails": 0, "down_until": 0.0}
+
+def _oai_mark(ok: bool) -> None:
+    if ok:
+        _oai_health["fails"] = 0
+        return
+    _oai_health["fails"] += 1
+    if _oai_health["fails"] >= OAI_FAIL_THRESHOLD:
+        _oai_health["down_until"] = time.monotonic() + OAI_COOLDOWN
+        _oai_health["fails"] = 0
+        print(f"[openai.cooldown] skipping OpenAI for {OAI_COOLDOWN:.0f}s", flush=True)
+
+def _hedge_delay() -> float:
+    if not HEDGE_ADAPTIVE or len(_OAI_LATENCIES) < _HEDGE_MIN_SAMPLES:
+        return HEDGE_DELAY
+    ordered = sorted(_OAI_LATENCIES)
+    return ordered[int(len(ordered) * 0.95) - 1]
+
+async def _generate_hedged(prompt: str) -> Tuple[str, str]:
+    """Return (raw draft, provider). Raises the last error if every provider failed."""
+    if time.monotonic() < _oai_health["down_until"]:
+        return await _hf_generate(REWRITER_MODELS, prompt), "hf"
+
+    tasks: Dict["asyncio.Task[str]", str] = {asyncio.ensure_future(_call_openai(prompt)): "openai"}
+    done, _ = await asyncio.wait(tasks, timeout=_hedge_delay())
+    if not done:
+        tasks[asyncio.ensure_future(_hf_generate(REWRITER_MODELS, prompt))] = "hf"
+
+    pending = set(tasks)
+    last_err: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is not None:
+                    last_err = t.exception()
+                    print(f"[{tasks[t]}.error] {last_err}", flush=True)
+                elif t.result():
+                    return t.result(), tasks[t]
+            # OpenAI failed inside the hedge window: fall back right away, as before
+            if not pending and "hf" not in tasks.values():
+                t = asyncio.ensure_future(_hf_generate(REWRITER_MODELS, prompt))
+                tasks[t] = "hf"
+                pending = {t}
+    finally:
+        for t in pending:
+            t.cancel()
+    if last_err is not None:
+        raise last_err
+    return "", "none"
+
 # ---------- Cleanup / shaping ----------
 # --- replace your _strip_mojibake with this version ---
 def _strip_mojibake(text: str) -> str:
@@ -238,8 +479,10 @@ def _strip_mojibake(text: str) -> str:
 
     t = text
 
-    # Detect mojibake patterns (bad CP1252/Latin-1 sequences)
-    if re.search(r"[\u0080-\u009F]|[Ââ][\u0080-\u00BF]|ð[\u0080-\u00BF]", t):
+    # Detect mojibake patterns (bad CP1252/Latin-1 sequences). ftfy judges the text itself, so the
+    # shared probe is enough; the lossy round-trip also needs a narrow pattern hit, or legitimate
+    # text like "château" would lose its accented letters.
+    if _SUSPECT(t) and (ftfy is not None or _RE_MOJIBAKE.search(t)):
         try:
             t = _fix_mojibake_roundtrip(t)
         except Exception:
@@ -251,18 +494,18 @@ def _strip_mojibake(text: str) -> str:
          .replace("Â ", " ")
     )
 
-    # Decode any HTML entities
-    t = html.unescape(t)
+    # Decode any HTML entities (every entity starts with "&")
+    if "&" in t:
+        t = html.unescape(t)
 
     # Strip CP1252 control chars and normalize ellipses
-    t = re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]", "", t)
-    t = re.sub(r"\s*\.\s*\.\s*\.?\s*", ". ", t)
+    t = t.translate(_CTRL_TABLE)
+    t = _RE_ELLIPSIS.sub(". ", t)
 
-    # Normalize newlines; allow only single blank lines
-    t = re.sub(r"(?:\r\n|\r|\n)", "\n", t)
-    lines = [ln.strip() for ln in t.split("\n")]
+    # Split on every newline flavour; allow only single blank lines
     cleaned, blank = [], 0
-    for ln in lines:
+    for ln in t.splitlines():
+        ln = ln.strip()
         if ln == "":
             blank += 1
             if blank <= 1:
@@ -310,6 +553,14 @@ def _choose_tags(body: str, topics: List[str], angle_key: str, base_tags: List[s
         if len(out) == 3: break
     return out
 
+def _trim_words(t: str, max_words: int, suffix: str) -> str:
+    """Cap t at max_words words. Splits at most max_words times, so a long draft's tail stays
+    one string instead of becoming a list of words that is thrown away."""
+    parts = t.split(None, max_words)
+    if len(parts) <= max_words:
+        return t
+    return " ".join(parts[:max_words]).rstrip(",;:") + suffix
+
 def _enforce_shape(t: str, max_words: int, angle: Optional[str], topics: List[str],
                    source_title: Optional[str], terms: List[str]) -> str:
     if not t:
@@ -361,22 +612,24 @@ def _enforce_shape(t: str, max_words: int, angle: Optional[str], topics: List[st
         body = body.rstrip(". ") + " " + q_map.get(angle_key, f"How would you respond to {subj} in your context?")
 
     # Word budget
-    words = body.split()
-    if len(words) > max_words:
-        body = " ".join(words[:max_words]).rstrip(",;:") + "."
+    body = _trim_words(body, max_words, ".")
 
     final_tags = _choose_tags(body=body, topics=topics, angle_key=angle_key, base_tags=tags, add_privacy=voice_priv)
 
     # Tidy
-    body = re.sub(r"\s*\.\s*\.\s*\.?\s*", ". ", body)
-    body = re.sub(r"\s{2,}", " ", body).strip()
+    body = _RE_ELLIPSIS.sub(". ", body)
+    body = _RE_WS_RUN.sub(" ", body).strip()
 
     return (body + "\n\n" + " ".join(final_tags)).strip()
 
-def _cleanup(out_text: str, req: ThoughtPostRequest) -> str:
-    t = _strip_mojibake(out_text or "")
+def _cleanup(out_text: str, req: Optional[ThoughtPostRequest] = None) -> str:
+    if not out_text:
+        return ""
+    if not _RE_NEEDS_CLEANUP.search(out_text):
+        return out_text.strip()
+    t = _strip_mojibake(out_text)
     # remove any raw URLs; the link card handles preview
-    t = re.sub(r'https?://\S+', '', t).strip()
+    t = _RE_URL.sub('', t).strip()
     return t
 
 
@@ -386,8 +639,9 @@ def _cleanup(out_text: str, req: ThoughtPostRequest) -> str:
 def _pick_deterministic(seq, seed_text, salt=""):
     if not seq:
         return None
-    h = hashlib.md5((seed_text + "|" + salt).encode("utf-8")).digest()
-    idx = int.from_bytes(h[:2], "big") % len(seq)
+    # non-cryptographic bucketing: 2 bytes of BLAKE2s is all the entropy we need
+    h = hashlib.blake2s(f"{seed_text}|{salt}".encode("utf-8"), digest_size=2).digest()
+    idx = int.from_bytes(h, "big") % len(seq)
     return seq[idx]
 
 def _structure_linkedin(core_text: str, max_words: int) -> str:
@@ -403,134 +657,128 @@ def _structure_linkedin(core_text: str, max_words: int) -> str:
 
     t = core_text
 
-    # Normalize newlines but DO NOT collapse single blank lines
-    t = re.sub(r"\r\n?", "\n", t)
-
-    # Trim whitespace per line but keep line structure
-    lines = [ln.rstrip() for ln in t.split("\n")]
-    t = "\n".join(lines)
+    # Normalize newlines (splitlines handles CRLF/CR) and trim each line, keeping line
+    # structure; single blank lines are NOT collapsed
+    t = "\n".join([ln.rstrip() for ln in t.splitlines()])
 
     # Cap excessive blank lines (3+ → 2)
-    t = re.sub(r"\n{3,}", "\n\n", t)
+    t = _RE_BLANKLINES.sub("\n\n", t)
 
     # Hard word budget
-    words = t.split()
-    if len(words) > max_words:
-        t = " ".join(words[:max_words]).rstrip(",;:") + "…"
+    t = _trim_words(t, max_words, "…")
 
     return t.strip()
 
+def _inline_markup_repl(m: "re.Match[str]") -> str:
+    kind = m.lastgroup
+    if kind == "url":
+        return ""                          # the link card handles preview
+    if kind == "tag":
+        return "#" + m.group("tagname")    # 'hashtag#Tag' -> '#Tag'
+    # markdown emphasis: keep the words, and clean whatever is nested inside
+    return _RE_INLINE.sub(_inline_markup_repl, m.group(kind))
+
 def _normalize_linkedin_markup(text: str) -> str:
     if not text:
         return ""
 
-    t = text
+    # 1) Normalize EOL up front so every later pass sees plain "\n"
+    t = text.replace("\r\n", "\n").replace("\r", "\n")
 
-    # 1) Kill markdown bold/italics markers only (keep words)
-    t = re.sub(r"\*\*(.*?)\*\*", r"\1", t)   # **bold**
-    t = re.sub(r"\*(.*?)\*", r"\1", t)       # *italic*
-    t = re.sub(r"_(.*?)_", r"\1", t)         # _italic_
+    # 2) Single scan: drop markdown bold/italic markers (keep words), rewrite
+    #    'hashtag#Tag' -> '#Tag', and remove raw URLs
+    t = _RE_INLINE.sub(_inline_markup_repl, t)
     # Remove any leftover `**` or `*` markers
-    t = t.replace("**", "")
     t = t.replace("*", "")
 
-
-    # 2) Convert numeric lists at line start to dash bullets
+    # 3) Convert numeric lists at line start to dash bullets
     #    "1. Foo" -> "– Foo"
-    lines = re.split(r"(?:\r\n|\r|\n)", t)
-    conv = []
-    for ln in lines:
-        conv.append(re.sub(r"^\s*\d+\.\s+", "– ", ln))
-    t = "\n".join(conv)
-
-    # 3) Normalize 'hashtag#Tag' -> '#Tag' (and collapse dup spaces)
-    t = re.sub(r"(?i)\bhashtag\s*#?(\w+)", r"#\1", t)
-
-    # 4) Ensure no raw URLs (the link card handles preview)
-    t = re.sub(r"https?://\S+", "", t).strip()
+    t = _RE_NUMLIST.sub("– ", t)
 
-    # 5) Keep short paragraphs with single blank lines
-    t = re.sub(r"[ \t]{2,}", " ", t)          # extra spaces
-    t = re.sub(r"(?:\r\n|\r|\n)", "\n", t)    # normalize EOL
-    t = re.sub(r"\n{3,}", "\n\n", t)          # cap blank lines
+    # 4) Keep short paragraphs with single blank lines
+    t = _RE_WS_RUN.sub(" ", t)   # extra spaces
+    t = _RE_BLANKLINES.sub("\n\n", t)   # cap blank lines
 
     return t.strip()
 
 # app/routers/thoughtpost.py
 
+def _first_sentence(s: str, limit: int = 240) -> str:
+    if not s:
+        return ""
+    s = _RE_URL.sub('', s)
+    if "&" in s:
+        s = html.unescape(s)
+    s = _RE_WS.sub(' ', s).strip()
+    parts = _FIRST_SENTENCE_SPLIT.split(s)
+    head = (parts[0] if parts else s).strip()
+    if len(head) > limit:
+        head = head[: limit - 1].rstrip(",;: ") + "…"
+    return head
+
+def _fallback_from_req(r: ThoughtPostRequest) -> str:
+    title   = (r.source_title or "").strip()
+    summary = (r.text or "").strip()
+    head = _first_sentence(summary) or (title if title else "Quick update")
+    if title and head and not head.lower().startswith(title.lower()):
+        headline = f"{title}: {head}"
+    else:
+        headline = head or (title or "Quick update")
+
+    if r.use_emojis:
+        e = ["✅", "🤔", "✨"]
+    else:
+        e = ["", "", ""]
+
+    body_lines = [
+        headline,
+        "",
+        f"• {e[0]} What changed / summary: {summary}",
+        f"• {e[1]} Impact & next step: explain how this matters",
+        "",
+        f"Reflect: {e[2]} What do you think about this change?"
+    ]
+    return "\n".join(body_lines).strip()
+
+async def _draft_without_openai(req: ThoughtPostRequest, prompt: str) -> str:
+    """HF draft, else the template fallback; for paths that have already spent their OpenAI attempt."""
+    try:
+        raw = await _hf_generate(REWRITER_MODELS, prompt)
+    except Exception as e:
+        print(f"[hf.error] {e}", flush=True)
+        raw = ""
+    return _cleanup(raw, req) or _fallback_from_req(req)
+
+def _prompt_for(req: ThoughtPostRequest) -> str:
+    return _build_prompt(
+        text=req.text,
+        tone=req.tone.strip(),
+        angle=req.angle,
+        max_words=req.max_words,
+        source_title=req.source_title,
+        source_link=req.source_link,
+        use_emojis=req.use_emojis,
+    )
+
 @router.post("/thoughtpost", response_model=ThoughtPostResponse)
 async def generate_thoughtpost(req: ThoughtPostRequest) -> Dict[str, str]:
-    import re as _re, html as _html
-
-    def _first_sentence(s: str, limit: int = 240) -> str:
-        if not s:
-            return ""
-        s = _re.sub(r'https?://\S+', '', s)
-        s = _html.unescape(s)
-        s = _re.sub(r'\s+', ' ', s).strip()
-        parts = _re.split(r'(?<=[.!?])\s+', s)
-        head = (parts[0] if parts else s).strip()
-        if len(head) > limit:
-            head = head[: limit - 1].rstrip(",;: ") + "…"
-        return head
-
-    def _fallback_from_req(r: ThoughtPostRequest) -> str:
-        title   = (r.source_title or "").strip()
-        summary = (r.text or "").strip()
-        head = _first_sentence(summary) or (title if title else "Quick update")
-        if title and head and not head.lower().startswith(title.lower()):
-            headline = f"{title}: {head}"
-        else:
-            headline = head or (title or "Quick update")
-
-        if r.use_emojis:
-            e = ["✅", "🤔", "✨"]
-        else:
-            e = ["", "", ""]
-
-        body_lines = [
-            headline,
-            "",
-            f"• {e[0]} What changed / summary: {summary}",
-            f"• {e[1]} Impact & next step: explain how this matters",
-            "",
-            f"Reflect: {e[2]} What do you think about this change?"
-        ]
-        return "\n".join(body_lines).strip()
-
     try:
-        prompt = _build_prompt(
-            text=req.text,
-            tone=req.tone.strip(),
-            angle=req.angle,
-            max_words=req.max_words,
-            source_title=req.source_title,
-            source_link=req.source_link,
-            use_emojis=req.use_emojis,
-        )
+        prompt = _prompt_for(req)
 
         raw = ""
         try:
-            raw = await _call_openai(prompt)
-            # Debug log: raw output from model
-            print("[DEBUG] raw output:", raw, flush=True)
+            raw, provider = await _generate_hedged(prompt)
+            # Debug log: raw output from whichever provider answered first
+            print(f"[DEBUG] raw output ({provider}):", raw, flush=True)
         except Exception as e:
-            print(f"[openai.error] {e}", flush=True)
-            try:
-                raw = await _hf_generate(REWRITER_MODELS, prompt)
-                print("[DEBUG] hf fallback raw output:", raw, flush=True)
-            except Exception as e2:
-                print(f"[hf.error] {e2}", flush=True)
-                raw = ""
+            print(f"[generate.error] {e}", flush=True)
+            raw = ""
 
+        # _cleanup is the single cleanup pass (mojibake, entities, whitespace, URLs)
         cleaned = _cleanup(raw, req)
         # Debug log: after cleanup
         print("[DEBUG] cleaned after _cleanup:", cleaned, flush=True)
 
-        cleaned = _re.sub(r'https?://\S+', '', cleaned or "").strip()
-        # Debug log: after URL strip
-        print("[DEBUG] cleaned after URL strip:", cleaned, flush=True)
-
         if not cleaned:
             cleaned = _fallback_from_req(req)
             print("[DEBUG] fallback used, fallback text:", cleaned, flush=True)
@@ -542,6 +790,166 @@ async def generate_thoughtpost(req: ThoughtPostRequest) -> Dict[str, str]:
         return {"draft": _fallback_from_req(req)}
 
 
+# Same draft as /thoughtpost, sent as text/plain while OpenAI is still generating. Cleanup runs
+# per paragraph (on blank-line boundaries), so the first paragraph reaches the client early.
+@router.post("/thoughtpost/stream")
+async def stream_thoughtpost(req: ThoughtPostRequest):
+    prompt = _prompt_for(req)
+    key = _oai_cache_key(prompt)
+    hit = _OAI_CACHE.get(key)
+    if (hit and hit[1] > time.monotonic()) or time.monotonic() < _oai_health["down_until"]:
+        # cache hit or OpenAI cooling down: the buffered path handles both without a new OpenAI call
+        async def _whole():
+            yield (await generate_thoughtpost(req))["draft"]
+        return StreamingResponse(_whole(), media_type="text/plain; charset=utf-8")
+
+    # keeps the OpenAI client and the upstream response open until the generator below finishes
+    scope = AsyncExitStack()
+    try:
+        client = await scope.enter_async_context(_oai_client())
+        stream = await _openai_stream(client, prompt)
+        scope.push_async_callback(stream.close)
+    except Exception as e:
+        await scope.aclose()
+        _oai_mark(False)
+        print(f"[openai.stream.error] {e}", flush=True)
+        # this request already spent its OpenAI attempt; go straight to HF
+        async def _hf_only():
+            yield await _draft_without_openai(req, prompt)
+        return StreamingResponse(_hf_only(), media_type="text/plain; charset=utf-8")
+
+    async def _paragraphs():
+        parts: List[str] = []
+        buf = ""
+        sent = False
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if not delta:
+                    continue
+                parts.append(delta)
+                buf += delta
+                while "\n\n" in buf:
+                    para, buf = buf.split("\n\n", 1)
+                    para = _cleanup(para, req)
+                    if para:
+                        yield ("\n\n" if sent else "") + para
+                        sent = True
+            _oai_mark(True)
+            _oai_store(key, "".join(parts).strip())
+        except Exception as e:
+            _oai_mark(False)
+            print(f"[openai.stream.error] {e}", flush=True)
+        finally:
+            # also runs when the client disconnects (GeneratorExit), releasing the pooled connection
+            await scope.aclose()
+        tail = _cleanup(buf, req)
+        if tail:
+            yield ("\n\n" if sent else "") + tail
+            sent = True
+        if not sent:
+            yield await _draft_without_openai(req, prompt)
+
+    return StreamingResponse(_paragraphs(), media_type="text/plain; charset=utf-8")
+
+
+# ---------- Batches ----------
+# Sync mode fans the drafts out through the normal pipeline, at most OAI_CONCURRENCY at a time
+# across all batch callers. ?async=true submits them to OpenAI's Batch API instead (half price,
+# completes within 24h) and returns a batch id to poll.
+OAI_CONCURRENCY = int(os.getenv("OAI_CONCURRENCY", "16"))
+BATCH_MAX = int(os.getenv("THOUGHTPOST_BATCH_MAX", "100"))
+_OAI_SEM: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+def _oai_sem() -> asyncio.Semaphore:
+    # created on the running loop: a semaphore bound to a previous loop (a restarted app,
+    # a TestClient without lifespan) raises as soon as a batch has to wait on it
+    global _OAI_SEM
+    loop = asyncio.get_running_loop()
+    if _OAI_SEM is None or _OAI_SEM[0] is not loop:
+        _OAI_SEM = (loop, asyncio.Semaphore(OAI_CONCURRENCY))
+    return _OAI_SEM[1]
+
+async def _bounded_thoughtpost(req: ThoughtPostRequest) -> Dict[str, str]:
+    async with _oai_sem():
+        return await generate_thoughtpost(req)
+
+@router.post("/thoughtpost/batch")
+async def generate_thoughtpost_batch(
+    reqs: List[ThoughtPostRequest],
+    async_mode: bool = Query(default=False, alias="async"),
+):
+    if not reqs:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(reqs) > BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {BATCH_MAX})")
+
+    if not async_mode:
+        # generate_thoughtpost never raises; each slot gets a draft or its fallback
+        return {"drafts": await asyncio.gather(*[_bounded_thoughtpost(r) for r in reqs])}
+
+    lines = [
+        json.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _oai_body(_prompt_for(r)),
+        }, ensure_ascii=False)
+        for i, r in enumerate(reqs)
+    ]
+    try:
+        async with _oai_client() as c:
+            f = await c.files.create(
+                file=("thoughtpost-batch.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch",
+            )
+            batch = await c.batches.create(
+                input_file_id=f.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+    except Exception as e:
+        print(f"[openai.batch.error] {e}", flush=True)
+        raise HTTPException(status_code=502, detail="Could not submit batch")
+    return {"batch_id": batch.id, "status": batch.status, "count": len(reqs)}
+
+@router.get("/thoughtpost/batch/{batch_id}")
+async def get_thoughtpost_batch(batch_id: str):
+    content = None
+    try:
+        # entering the client is inside the try too: without an API key it raises right there
+        async with _oai_client() as c:
+            batch = await c.batches.retrieve(batch_id)
+            if batch.status == "completed" and batch.output_file_id:
+                content = await c.files.content(batch.output_file_id)
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    except Exception as e:
+        print(f"[openai.batch.error] {e}", flush=True)
+        raise HTTPException(status_code=502, detail="Could not fetch batch")
+    if content is None:
+        return {"batch_id": batch.id, "status": batch.status, "drafts": None}
+
+    by_id: Dict[int, str] = {}
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        try:
+            raw = row["response"]["body"]["choices"][0]["message"]["content"] or ""
+        except (KeyError, IndexError, TypeError):
+            raw = ""  # failed entry; the caller can resubmit just that slot
+        by_id[int(row["custom_id"])] = _cleanup(raw)
+    total = batch.request_counts.total if batch.request_counts else len(by_id)
+    return {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "drafts": [{"draft": by_id.get(i, "")} for i in range(total)],
+    }
+
+
 @router.get("/thoughtpost/ping")
 async def thoughtpost_ping():
     return {"ok": True}
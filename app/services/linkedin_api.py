@@ -1,7 +1,7 @@
 ﻿# app/services/linkedin_api.py
 import httpx
 import time
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, AsyncIterable, Optional, Union
 from urllib.parse import urlencode, quote
 from app.config import settings
 import os
@@ -171,15 +171,20 @@ def userinfo_sub(access_token: str) -> str:
         print(f"[userinfo_sub] error: {e}", flush=True)
         return ""
 
-# Create an article share (OG link)
-def post_article_share(access_token: str, author_urn: str, url: str, text: str = "") -> tuple:
-    text = _sanitize_for_linkedin(text)
-    payload = {
+def _ugc_headers(access_token: str) -> Dict[str, str]:
+    # Let httpx set Content-Type appropriately for JSON
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "X-Restli-Protocol-Version": "2.0.0",
+    }
+
+def _article_share_payload(author_urn: str, url: str, text: str) -> Dict[str, Any]:
+    return {
         "author": author_urn,
         "lifecycleState": "PUBLISHED",
         "specificContent": {
             "com.linkedin.ugc.ShareContent": {
-                "shareCommentary": {"text": text},
+                "shareCommentary": {"text": _sanitize_for_linkedin(text)},
                 "shareMediaCategory": "ARTICLE",
                 "media": [{"status": "READY", "originalUrl": url}]
             }
@@ -187,25 +192,31 @@ def post_article_share(access_token: str, author_urn: str, url: str, text: str =
         "visibility": {"com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"},
     }
 
+# Create an article share (OG link)
+def post_article_share(access_token: str, author_urn: str, url: str, text: str = "") -> tuple:
+    payload = _article_share_payload(author_urn, url, text)
+
     # REMOVE the manual dumps/bytes
     # body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
 
     with httpx.Client(timeout=60) as c:
         r = c.post(
             UGC_URL,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                # Let httpx set Content-Type appropriately for JSON
-                "X-Restli-Protocol-Version": "2.0.0",
-            },
+            headers=_ugc_headers(access_token),
             json=payload,  # <— let httpx serialize and set UTF-8 correctly
         )
         return r.status_code in (201, 202), r
 
-# Register image upload
-def register_image_upload(access_token: str, author_urn: str) -> dict:
-    register_url = "https://api.linkedin.com/v2/assets?action=registerUpload"
-    payload = {
+async def post_article_share_async(access_token: str, author_urn: str, url: str, text: str = "") -> tuple:
+    payload = _article_share_payload(author_urn, url, text)
+    async with httpx.AsyncClient(timeout=60) as c:
+        r = await c.post(UGC_URL, headers=_ugc_headers(access_token), json=payload)
+        return r.status_code in (201, 202), r
+
+REGISTER_UPLOAD_URL = "https://api.linkedin.com/v2/assets?action=registerUpload"
+
+def _register_upload_payload(author_urn: str) -> Dict[str, Any]:
+    return {
         "registerUploadRequest": {
             "owner": author_urn,
             "recipes": ["urn:li:digitalmediaRecipe:feedshare-image"],
@@ -215,14 +226,30 @@ def register_image_upload(access_token: str, author_urn: str) -> dict:
             }]
         }
     }
+
+def _register_upload_headers(access_token: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+
+# Register image upload
+def register_image_upload(access_token: str, author_urn: str) -> dict:
     with httpx.Client(timeout=60) as c:
         r = c.post(
-            register_url,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
+            REGISTER_UPLOAD_URL,
+            headers=_register_upload_headers(access_token),
+            json=_register_upload_payload(author_urn),
+        )
+        r.raise_for_status()
+        return r.json()
+
+async def register_image_upload_async(access_token: str, author_urn: str) -> dict:
+    async with httpx.AsyncClient(timeout=60) as c:
+        r = await c.post(
+            REGISTER_UPLOAD_URL,
+            headers=_register_upload_headers(access_token),
+            json=_register_upload_payload(author_urn),
         )
         r.raise_for_status()
         return r.json()
@@ -234,15 +261,27 @@ def upload_image_asset(upload_url: str, image_bytes: bytes) -> bool:
         r = c.put(upload_url, headers=headers, content=image_bytes)
         return r.status_code in (201, 202)
 
-# Create image share post
-def post_image_share(access_token: str, author_urn: str, asset_urn: str, text: str = "") -> tuple:
-    text = _sanitize_for_linkedin(text)
-    payload = {
+async def upload_image_asset_async(
+    upload_url: str,
+    content: Union[bytes, AsyncIterable[bytes]],
+    content_length: Optional[int] = None,
+) -> bool:
+    """PUT the image to LinkedIn's upload URL. content may be an async chunk iterator, which is
+    streamed as it is read; pass content_length with it to avoid chunked transfer encoding."""
+    headers = {"Content-Type": "application/octet-stream"}
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
+    async with httpx.AsyncClient(timeout=60) as c:
+        r = await c.put(upload_url, headers=headers, content=content)
+        return r.status_code in (201, 202)
+
+def _image_share_payload(author_urn: str, asset_urn: str, text: str) -> Dict[str, Any]:
+    return {
         "author": author_urn,
         "lifecycleState": "PUBLISHED",
         "specificContent": {
             "com.linkedin.ugc.ShareContent": {
-                "shareCommentary": {"text": text},
+                "shareCommentary": {"text": _sanitize_for_linkedin(text)},
                 "shareMediaCategory": "IMAGE",
                 "media": [{"status": "READY", "media": asset_urn}]
             }
@@ -250,19 +289,26 @@ def post_image_share(access_token: str, author_urn: str, asset_urn: str, text: s
         "visibility": {"com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"},
     }
 
+# Create image share post
+def post_image_share(access_token: str, author_urn: str, asset_urn: str, text: str = "") -> tuple:
+    payload = _image_share_payload(author_urn, asset_urn, text)
+
     # body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
 
     with httpx.Client(timeout=60) as c:
         r = c.post(
             UGC_URL,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "X-Restli-Protocol-Version": "2.0.0",
-            },
+            headers=_ugc_headers(access_token),
             json=payload,  # <—
         )
         return r.status_code in (201, 202), r
 
+async def post_image_share_async(access_token: str, author_urn: str, asset_urn: str, text: str = "") -> tuple:
+    payload = _image_share_payload(author_urn, asset_urn, text)
+    async with httpx.AsyncClient(timeout=60) as c:
+        r = await c.post(UGC_URL, headers=_ugc_headers(access_token), json=payload)
+        return r.status_code in (201, 202), r
+
 # Exchange refresh_token for new access token
 def exchange_refresh_for_token(refresh_token: str) -> dict:
     data = {
@@ -363,88 +409,102 @@ def exchange_refresh_for_token(refresh_token: str) -> Dict[str, Any]:
     resp.raise_for_status()
     return resp.json()
 
-def post_text(access_token: str, author_urn: str, text: str) -> Tuple[bool, Any]:
-    text = _sanitize_for_linkedin(text)
-    payload = {
+def _text_share_payload(author_urn: str, text: str) -> Dict[str, Any]:
+    return {
         "author": author_urn,
         "lifecycleState": "PUBLISHED",
         "specificContent": {
             "com.linkedin.ugc.ShareContent": {
-                "shareCommentary": {"text": text},
+                "shareCommentary": {"text": _sanitize_for_linkedin(text)},
                 "shareMediaCategory": "NONE",
             }
         },
         "visibility": {"com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"},
     }
 
+def _post_text_result(r: httpx.Response, payload: Dict[str, Any], access_token: str) -> Tuple[bool, Any]:
+    """Log the ugcPosts response and turn it into post_text's (ok, ref) result."""
+    # Basic logs (kept)
+    print("[post_text] status:", r.status_code, flush=True)
+    print("[post_text] request json:", payload, flush=True)
+    print("[post_text] response text:", r.text, flush=True)
+    log_request_id(r)
+
+    # Verbose: print request headers, response headers when enabled
+    if VERBOSE_LINKEDIN_LOG:
+        try:
+            verbose_out = {
+                "request_headers": {
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": "application/json",
+                    "X-Restli-Protocol-Version": "2.0.0",
+                },
+                "request_json": payload,
+                "response_status": r.status_code,
+                "response_headers": dict(r.headers),
+                "response_text": r.text,
+            }
+            try:
+                with open('/tmp/linkedin_verbose.log', 'a') as f:
+                    f.write("--- POST_TEXT VERBOSE ---\n")
+                    f.write(str(verbose_out) + "\n")
+            except Exception:
+                pass
+        except Exception:
+            pass
+    # Additionally, when verbose enabled, print request headers/body and response headers to stdout
+    if VERBOSE_LINKEDIN_LOG:
+        try:
+            req = getattr(r, 'request', None)
+            if req is not None:
+                try:
+                    req_body = req.content.decode('utf-8') if isinstance(req.content, (bytes, bytearray)) else str(req.content)
+                except Exception:
+                    req_body = str(req.content)
+                print('[post_text][VERBOSE] Outgoing request headers:', dict(req.headers), flush=True)
+                print('[post_text][VERBOSE] Outgoing request body:', req_body, flush=True)
+            print('[post_text][VERBOSE] Response headers:', dict(r.headers), flush=True)
+        except Exception as e:
+            print('[post_text][VERBOSE] error printing verbose info:', e, flush=True)
+    if r.status_code in (201, 202):
+        return True, r
+    # Bubble up error details for 4xx/5xx
+    error_info = {
+        "status": r.status_code,
+        "body": r.text
+    }
+    try:
+        err_json = r.json()
+        error_info["serviceErrorCode"] = err_json.get("serviceErrorCode")
+        error_info["message"] = err_json.get("message")
+    except Exception:
+        pass
+    return False, error_info
+
+def post_text(access_token: str, author_urn: str, text: str) -> Tuple[bool, Any]:
+    payload = _text_share_payload(author_urn, text)
+
     # body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
 
     try:
         with httpx.Client(timeout=60) as c:
             r = c.post(
                 UGC_URL,
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "X-Restli-Protocol-Version": "2.0.0",
-                },
+                headers=_ugc_headers(access_token),
                 json=payload,  # <—
             )
-            # Basic logs (kept)
-            print("[post_text] status:", r.status_code, flush=True)
-            print("[post_text] request json:", payload, flush=True)
-            print("[post_text] response text:", r.text, flush=True)
-            log_request_id(r)
+            return _post_text_result(r, payload, access_token)
+    except Exception as e:
+        print("[post_text] error:", e, flush=True)
+        return False, {"exception": str(e)}
 
-            # Verbose: print request headers, response headers when enabled
-            if VERBOSE_LINKEDIN_LOG:
-                try:
-                    verbose_out = {
-                        "request_headers": {
-                            "Authorization": f"Bearer {access_token}",
-                            "Content-Type": "application/json",
-                            "X-Restli-Protocol-Version": "2.0.0",
-                        },
-                        "request_json": payload,
-                        "response_status": r.status_code,
-                        "response_headers": dict(r.headers),
-                        "response_text": r.text,
-                    }
-                    try:
-                        with open('/tmp/linkedin_verbose.log', 'a') as f:
-                            f.write("--- POST_TEXT VERBOSE ---\n")
-                            f.write(str(verbose_out) + "\n")
-                    except Exception:
-                        pass
-                except Exception:
-                    pass
-            # Additionally, when verbose enabled, print request headers/body and response headers to stdout
-            if VERBOSE_LINKEDIN_LOG:
-                try:
-                    req = getattr(r, 'request', None)
-                    if req is not None:
-                        try:
-                            req_body = req.content.decode('utf-8') if isinstance(req.content, (bytes, bytearray)) else str(req.content)
-                        except Exception:
-                            req_body = str(req.content)
-                        print('[post_text][VERBOSE] Outgoing request headers:', dict(req.headers), flush=True)
-                        print('[post_text][VERBOSE] Outgoing request body:', req_body, flush=True)
-                    print('[post_text][VERBOSE] Response headers:', dict(r.headers), flush=True)
-                except Exception as e:
-                    print('[post_text][VERBOSE] error printing verbose info:', e, flush=True)
-            if r.status_code in (201, 202):
-                return True, r
-            # Bubble up error details for 4xx/5xx
-            error_info = {
-                "status": r.status_code,
-                "body": r.text
-            }
-            try:
-                err_json = r.json()
-                error_info["serviceErrorCode"] = err_json.get("serviceErrorCode")
-                error_info["message"] = err_json.get("message")
-            except Exception:
-                pass
-            return False, error_info
+async def post_text_async(access_token: str, author_urn: str, text: str) -> Tuple[bool, Any]:
+    """Async twin of post_text for async handlers; same payload, logging and result shape."""
+    payload = _text_share_payload(author_urn, text)
+    try:
+        async with httpx.AsyncClient(timeout=60) as c:
+            r = await c.post(UGC_URL, headers=_ugc_headers(access_token), json=payload)
+            return _post_text_result(r, payload, access_token)
     except Exception as e:
         print("[post_text] error:", e, flush=True)
         return False, {"exception": str(e)}
@@ -1,5 +1,6 @@
 # app/services/rewrite.py
 import os
+from functools import lru_cache
 from typing import Optional
 import re, html
 
@@ -20,18 +21,37 @@ if OpenAI and _API_KEY:
         _client = None
 
 
+_RE_BLANKLINES = re.compile(r"\n{3,}")
+_RE_URL = re.compile(r"https?://\S+")
+
+
 def _light_cleanup(s: str) -> str:
     if not s:
         return ""
-    t = html.unescape(s)
+    # nothing below can change such text beyond the outer strip
+    if "&" not in s and "\r" not in s and "\n\n\n" not in s and "http" not in s:
+        return s.strip()
+    t = html.unescape(s) if "&" in s else s
     # normalize newlines and limit multiple blank lines
-    t = re.sub(r"(?:\r\n|\r|\n)", "\n", t)
-    t = re.sub(r"\n{3,}", "\n\n", t)
+    t = t.replace("\r\n", "\n").replace("\r", "\n")
+    t = _RE_BLANKLINES.sub("\n\n", t)
     # remove raw URLs (your link card handles preview)
-    t = re.sub(r"https?://\S+", "", t)
+    t = _RE_URL.sub("", t)
     return t.strip()
 
 
+@lru_cache(maxsize=512)
+def _complete(prompt: str) -> str:
+    """One chat completion per distinct prompt; errors propagate and are not cached."""
+    resp = _client.chat.completions.create(
+        model=_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.5,
+        max_tokens=400,
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+
 def rewrite_linkedin(text: str, tone: str = "professional") -> str:
     """
     OpenAI-first, no Hugging Face, never raises.
@@ -57,13 +77,7 @@ def rewrite_linkedin(text: str, tone: str = "professional") -> str:
     )
 
     try:
-        resp = _client.chat.completions.create(
-            model=_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=400,
-        )
-        out = (resp.choices[0].message.content or "").strip()
+        out = _complete(prompt)
         return _light_cleanup(out) or _light_cleanup(base)
     except Exception:
         # Fail-safe: never crash the request
@@ -6,6 +6,15 @@ from app.main import app
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def _clear_publish_caches():
+    # linkedin_publish memoizes tokens/member ids per user_id; keep tests independent
+    from app.routers import linkedin_publish
+    for cache in (linkedin_publish._ACCESS_TOKEN_CACHE, linkedin_publish._MEMBER_ID_CACHE,
+                  linkedin_publish._ID_TOKEN_CACHE):
+        cache.clear()
+    yield
+
 @patch("app.db.crud_tokens.get_latest_refresh_token")
 @patch("app.services.linkedin_api.exchange_refresh_for_token")
 @patch("app.db.crud_tokens.update_access_token_only")
@@ -20,20 +29,23 @@ def test_refresh_happy_path(mock_update, mock_exchange, mock_get_refresh):
 @patch("app.db.crud_tokens.get_latest_token")
 @patch("app.db.models.User")
 def test_post_uses_stored_member_id_when_missing_in_body(mock_user, mock_get_token):
+    from app.routers import linkedin_publish
     mock_token = MagicMock()
     mock_token.access_token_encrypted = "enc"
+    mock_token.expires_at = None
     mock_user_obj = MagicMock()
     mock_user_obj.member_id = "stored_id"
     mock_get_token.return_value = mock_token
     with patch("app.db.token_crypto.decrypt_token", return_value="access"), \
-         patch("app.services.linkedin_api.post_text", return_value=(True, "ref")), \
+         patch("app.services.linkedin_api.post_text_async", return_value=(True, "ref")), \
          patch("app.services.linkedin_api.userinfo_sub", return_value="stored_id"), \
-         patch("sqlalchemy.orm.Session.query") as mock_query:
-        mock_query.return_value.filter.return_value.first.return_value = mock_user_obj
+         patch("app.routers.linkedin_publish.decode_linkedin_id_token_sync", return_value={"sub": "stored_id"}), \
+         patch("sqlalchemy.orm.Session.get", return_value=mock_user_obj) as mock_db_get:
         resp = client.post("/linkedin/post", json={"user_id": 1, "text": "hi"})
         assert resp.status_code == 200
         assert resp.json()["status"] == "posted"
         assert resp.json()["ref"] == "ref"
+        mock_db_get.assert_called_with(linkedin_publish.User, 1)
 
 @patch("app.db.crud_tokens.get_latest_token")
 @patch("app.db.crud_tokens.is_token_expiring", return_value=True)
@@ -48,7 +60,7 @@ def test_post_triggers_refresh_when_expired(mock_update, mock_exchange, mock_get
     mock_exchange.return_value = {"access_token": "new_access", "expires_in": 3600}
     mock_update.return_value = MagicMock()
     with patch("app.db.token_crypto.decrypt_token", return_value="access"), \
-        patch("app.services.linkedin_api.post_text", return_value=(True, "ref")), \
+        patch("app.services.linkedin_api.post_text_async", return_value=(True, "ref")), \
         patch("app.services.linkedin_api.userinfo_sub", return_value="stored_id"), \
         patch("app.db.models.User") as mock_user:
         mock_user_obj = MagicMock()
@@ -59,3 +71,146 @@ def test_post_triggers_refresh_when_expired(mock_update, mock_exchange, mock_get
         assert resp.json()["status"] == "posted"
         assert resp.json()["ref"] == "ref"
         mock_update.assert_called_with(ANY, 1, "new_access", 3600)
+
+@patch("app.db.crud_tokens.get_latest_token")
+@patch("app.db.crud_tokens.is_token_expiring", return_value=False)
+def test_access_token_cached_between_posts_and_dropped_on_401(mock_expiring, mock_get_token):
+    from app.routers import linkedin_publish
+    mock_token = MagicMock()
+    mock_token.access_token_encrypted = "enc"
+    mock_token.expires_at = None
+    mock_get_token.return_value = mock_token
+    with patch("app.db.token_crypto.decrypt_token", return_value="access") as mock_decrypt, \
+         patch("app.routers.linkedin_publish._resolve_author_from_token", return_value="urn:li:person:stored_id"), \
+         patch("app.services.linkedin_api.post_text_async", return_value=(True, "ref")):
+        for _ in range(2):
+            resp = client.post("/linkedin/post", json={"user_id": 7, "text": "hi"})
+            assert resp.status_code == 200
+        assert mock_get_token.call_count == 1
+        assert mock_decrypt.call_count == 1
+        assert 7 in linkedin_publish._ACCESS_TOKEN_CACHE
+
+    with patch("app.routers.linkedin_publish._resolve_author_from_token", return_value="urn:li:person:stored_id"), \
+         patch("app.services.linkedin_api.post_text_async",
+               return_value=(False, {"status": 401, "message": "expired"})):
+        resp = client.post("/linkedin/post", json={"user_id": 7, "text": "hi"})
+        assert resp.status_code == 401
+    assert 7 not in linkedin_publish._ACCESS_TOKEN_CACHE
+
+_REG = {"value": {"asset": "urn:li:digitalmediaAsset:1", "uploadMechanism": {
+    "com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest": {"uploadUrl": "https://upload.example/put"}}}}
+
+def _upload_patches(seen):
+    """Fake LinkedIn around a real httpx PUT, so the chunked request body is actually streamed."""
+    import httpx
+    real_client = httpx.AsyncClient
+
+    class Transport(httpx.AsyncBaseTransport):
+        # unlike httpx.MockTransport, reads the body piece by piece as a socket write would
+        async def handle_async_request(self, request):
+            seen["content_length"] = request.headers.get("content-length")
+            seen["chunks"] = []
+            async for part in request.stream:
+                seen["chunks"].append(len(part))
+            return httpx.Response(201)
+
+    def fake_client(*args, **kwargs):
+        return real_client(transport=Transport())
+
+    return [
+        patch("app.routers.linkedin_publish._get_fresh_access_token", return_value="access"),
+        patch("app.routers.linkedin_publish._resolve_author_from_token", return_value="urn:li:person:me"),
+        patch("app.services.linkedin_api.register_image_upload_async", return_value=_REG),
+        patch("app.services.linkedin_api.post_image_share_async", return_value=(True, MagicMock(text="ref"))),
+        patch("app.services.linkedin_api.httpx.AsyncClient", side_effect=fake_client),
+    ]
+
+def _run_with(patches, fn):
+    from contextlib import ExitStack
+    with ExitStack() as stack:
+        mocks = [stack.enter_context(p) for p in patches]
+        return fn(mocks)
+
+def test_image_upload_streams_file_in_chunks():
+    seen = {}
+    data = b"x" * 150_000
+    resp = _run_with(_upload_patches(seen), lambda m: client.post(
+        "/linkedin/post/image/upload", data={"user_id": "1", "text": "hi"},
+        files={"image": ("a.png", data, "image/png")}))
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "posted", "ref": "ref"}
+    assert seen["content_length"] == "150000"
+    assert seen["chunks"] == [65536, 65536, 150_000 - 2 * 65536]
+
+def test_image_upload_rejects_empty_file_before_register():
+    seen = {}
+
+    def go(mocks):
+        resp = client.post("/linkedin/post/image/upload", data={"user_id": "1"},
+                           files={"image": ("a.png", b"", "image/png")})
+        mocks[2].assert_not_called()
+        return resp
+
+    assert _run_with(_upload_patches(seen), go).status_code == 400
+
+def test_image_upload_rejects_oversized_file_before_register():
+    from app.routers import linkedin_publish
+    seen = {}
+
+    def go(mocks):
+        with patch.object(linkedin_publish.settings, "max_image_upload_bytes", 1000):
+            resp = client.post("/linkedin/post/image/upload", data={"user_id": "1"},
+                               files={"image": ("a.png", b"x" * 1001, "image/png")})
+        mocks[2].assert_not_called()
+        return resp
+
+    assert _run_with(_upload_patches(seen), go).status_code == 413
+
+def test_image_upload_of_unknown_size_stops_at_limit_with_413():
+    import asyncio, io
+    from fastapi import HTTPException, UploadFile
+    from app.routers import linkedin_publish
+    seen = {}
+    image = UploadFile(io.BytesIO(b"x" * 200_000))  # no size: the cap can only trip mid-stream
+    assert image.size is None
+
+    def go(mocks):
+        with patch.object(linkedin_publish.settings, "max_image_upload_bytes", 100_000):
+            with pytest.raises(HTTPException) as exc:
+                asyncio.run(linkedin_publish.post_image_upload(
+                    image=image, user_id=1, text="", member_id=None, db=None, request=None))
+        mocks[3].assert_not_called()  # nothing gets shared after a rejected upload
+        return exc.value
+
+    assert _run_with(_upload_patches(seen), go).status_code == 413
+    assert seen["chunks"] == [65536]  # chunk two would cross the limit and is never sent
+
+def test_id_token_cache_stays_bounded_under_concurrent_decodes():
+    from concurrent.futures import ThreadPoolExecutor
+    from app.routers import linkedin_publish
+
+    def decode(token, **kwargs):
+        return {"sub": token, "iss": "https://www.linkedin.com/oauth"}
+
+    with patch.object(linkedin_publish, "_ID_TOKEN_CACHE_MAX", 8), \
+         patch("app.routers.linkedin_publish.decode_linkedin_id_token_sync", side_effect=decode):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            subs = list(pool.map(lambda i: linkedin_publish._decode_cached(f"tok{i % 40}")[0], range(400)))
+    assert subs == [f"tok{i % 40}" for i in range(400)]
+    assert len(linkedin_publish._ID_TOKEN_CACHE) <= 8
+
+@patch("app.db.crud_tokens.save_linkedin_token")
+@patch("app.db.crud_tokens.upsert_user")
+@patch("app.services.linkedin_api.exchange_code_for_token")
+def test_login_callback_drops_cached_access_token(mock_exchange, mock_upsert, mock_save):
+    from app.routers import auth_linkedin, linkedin_publish
+    mock_exchange.return_value = {"access_token": "after_login", "expires_in": 3600}
+    mock_upsert.return_value = MagicMock(id=7, member_id=None)
+    linkedin_publish._ACCESS_TOKEN_CACHE[7] = ("before_login", float("inf"))
+    auth_linkedin.STATE_STORE.add("s1")
+    with patch("app.db.token_crypto.encrypt_token", side_effect=lambda t: "enc:" + t), \
+         patch.object(auth_linkedin, "ENABLE_OAUTH_LOGIN", False):
+        resp = client.get("/auth/linkedin/callback", params={"code": "c", "state": "s1"})
+    assert resp.status_code == 200
+    mock_save.assert_called_once()
+    assert 7 not in linkedin_publish._ACCESS_TOKEN_CACHE
@@ -45,7 +45,7 @@ def test_publish_derives_member_id_and_posts(monkeypatch):
 
     posted = {}
 
-    def fake_post_text(access_token, author_urn, text):
+    async def fake_post_text(access_token, author_urn, text):
         posted['author'] = author_urn
         posted['text'] = text
         return True, type('R', (), {'text': 'ok'})()
@@ -54,7 +54,7 @@ def test_publish_derives_member_id_and_posts(monkeypatch):
     monkeypatch.setattr(crud_tokens, "get_latest_token", fake_get_latest_token)
     monkeypatch.setattr('app.db.token_crypto.decrypt_token', lambda enc: 'plain-token')
     monkeypatch.setattr(linkedin_api, "userinfo_sub", fake_userinfo_sub)
-    monkeypatch.setattr(linkedin_api, "post_text", fake_post_text)
+    monkeypatch.setattr(linkedin_api, "post_text_async", fake_post_text)
 
     # Ensure user exists without member_id
     # We'll use the real DB to create a user
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import pytest
+
+from app.routers import thoughtpost
+
+
+@pytest.fixture(autouse=True)
+def _reset_hedge_state(monkeypatch):
+    monkeypatch.setattr(thoughtpost, "HEDGE_ADAPTIVE", False)
+    monkeypatch.setattr(thoughtpost, "HEDGE_DELAY", 0.05)
+    monkeypatch.setitem(thoughtpost._oai_health, "fails", 0)
+    monkeypatch.setitem(thoughtpost._oai_health, "down_until", 0.0)
+    monkeypatch.setattr(thoughtpost, "OAI_CACHE_TTL", 0)
+    thoughtpost._OAI_INFLIGHT.clear()
+    thoughtpost._OAI_WAITERS.clear()
+    yield
+
+
+def _providers(monkeypatch, openai, hf):
+    calls = {"openai": 0, "hf": 0}
+
+    async def fake_openai(prompt):
+        calls["openai"] += 1
+        return await openai()
+
+    async def fake_hf(models, prompt):
+        calls["hf"] += 1
+        return await hf()
+
+    # patched below the single-flight/shield layer so cancellation is exercised for real
+    monkeypatch.setattr(thoughtpost, "_openai_complete", fake_openai)
+    monkeypatch.setattr(thoughtpost, "_hf_generate", fake_hf)
+    return calls
+
+
+def test_hedge_returns_openai_without_calling_hf(monkeypatch):
+    async def openai():
+        return "from openai"
+
+    async def hf():
+        return "from hf"
+
+    calls = _providers(monkeypatch, openai, hf)
+    assert asyncio.run(thoughtpost._generate_hedged("p")) == ("from openai", "openai")
+    assert calls["hf"] == 0
+
+
+def test_hedge_falls_back_when_openai_errors_inside_window(monkeypatch):
+    async def openai():
+        raise RuntimeError("boom")
+
+    async def hf():
+        return "from hf"
+
+    calls = _providers(monkeypatch, openai, hf)
+    assert asyncio.run(thoughtpost._generate_hedged("p")) == ("from hf", "hf")
+    assert calls == {"openai": 1, "hf": 1}
+    assert thoughtpost._oai_health["fails"] == 1
+
+
+def test_hedge_falls_back_on_empty_openai_result(monkeypatch):
+    async def openai():
+        return ""
+
+    async def hf():
+        return "from hf"
+
+    _providers(monkeypatch, openai, hf)
+    assert asyncio.run(thoughtpost._generate_hedged("p")) == ("from hf", "hf")
+    assert thoughtpost._oai_health["fails"] == 0
+
+
+def test_hedge_fires_hf_after_delay_and_cancels_slow_openai(monkeypatch):
+    cancelled = []
+
+    async def openai():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "late openai"
+
+    async def hf():
+        return "from hf"
+
+    _providers(monkeypatch, openai, hf)
+
+    async def run():
+        result = await thoughtpost._generate_hedged("p")
+        await asyncio.sleep(0.01)  # let the cancellation land; the loop is still running
+        # the upstream call is gone now, not when asyncio.run tears the loop down
+        assert cancelled == [True]
+        assert thoughtpost._OAI_INFLIGHT == {}
+        assert thoughtpost._OAI_WAITERS == {}
+        return result
+
+    assert asyncio.run(run()) == ("from hf", "hf")
+
+
+def test_hedge_keeps_shared_openai_call_and_counts_its_late_error(monkeypatch):
+    async def openai():
+        await asyncio.sleep(0.2)
+        raise RuntimeError("timeout")
+
+    async def hf():
+        return "from hf"
+
+    calls = _providers(monkeypatch, openai, hf)
+
+    async def run():
+        other = asyncio.ensure_future(thoughtpost._call_openai("p"))
+        await asyncio.sleep(0)  # other caller joins the in-flight request first
+        hedged = await thoughtpost._generate_hedged("p")
+        with pytest.raises(RuntimeError):
+            await other
+        return hedged
+
+    assert asyncio.run(run()) == ("from hf", "hf")
+    assert calls["openai"] == 1  # single-flight: one upstream call for both callers
+    assert thoughtpost._oai_health["fails"] == 1  # failed after the hedge left, still counted
+
+
+def test_cooldown_skips_openai_after_repeated_failures(monkeypatch):
+    monkeypatch.setattr(thoughtpost, "OAI_FAIL_THRESHOLD", 2)
+
+    async def openai():
+        raise RuntimeError("boom")
+
+    async def hf():
+        return "from hf"
+
+    calls = _providers(monkeypatch, openai, hf)
+    for _ in range(2):
+        asyncio.run(thoughtpost._generate_hedged("p"))
+    assert calls["openai"] == 2
+    assert thoughtpost._oai_health["down_until"] > 0
+
+    assert asyncio.run(thoughtpost._generate_hedged("p")) == ("from hf", "hf")
+    assert calls["openai"] == 2  # skipped while cooling down
+
+
+def test_adaptive_hedge_delay_uses_observed_p95(monkeypatch):
+    monkeypatch.setattr(thoughtpost, "HEDGE_ADAPTIVE", True)
+    monkeypatch.setattr(thoughtpost, "_OAI_LATENCIES", thoughtpost.deque([float(i) for i in range(1, 101)], maxlen=200))
+    assert thoughtpost._hedge_delay() == 95.0
+
+    monkeypatch.setattr(thoughtpost, "_OAI_LATENCIES", thoughtpost.deque([1.0], maxlen=200))
+    assert thoughtpost._hedge_delay() == thoughtpost.HEDGE_DELAY
+
+
+class _FakeStream:
+    def __init__(self, pieces):
+        self._pieces = list(pieces)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._pieces:
+            raise StopAsyncIteration
+        piece = self._pieces.pop(0)
+        delta = type("D", (), {"content": piece})()
+        return type("C", (), {"choices": [type("Ch", (), {"delta": delta})()]})()
+
+    async def close(self):
+        self.closed = True
+
+
+def _stream_client(monkeypatch, opener):
+    from contextlib import asynccontextmanager
+
+    @asynccontextmanager
+    async def fake_client():
+        yield object()
+
+    monkeypatch.setattr(thoughtpost, "_oai_client", fake_client)
+    monkeypatch.setattr(thoughtpost, "_openai_stream", opener)
+    monkeypatch.setattr(thoughtpost, "OAI_CACHE_TTL", 0)
+    from fastapi.testclient import TestClient
+    from app.main import app
+    return TestClient(app)
+
+
+def test_stream_closes_upstream_response(monkeypatch):
+    stream = _FakeStream(["First para.\n\n", "Second para."])
+
+    async def opener(client, prompt):
+        return stream
+
+    client = _stream_client(monkeypatch, opener)
+    resp = client.post("/generate/thoughtpost/stream", json={"text": "hello"})
+    assert resp.status_code == 200
+    assert resp.text == "First para.\n\nSecond para."
+    assert stream.closed
+
+
+def test_stream_open_failure_goes_to_hf_without_second_openai_call(monkeypatch):
+    opens = []
+
+    async def opener(client, prompt):
+        opens.append(prompt)
+        raise RuntimeError("boom")
+
+    async def openai(prompt):
+        raise AssertionError("OpenAI must not be retried")
+
+    async def hf(models, prompt):
+        return "from hf"
+
+    client = _stream_client(monkeypatch, opener)
+    monkeypatch.setattr(thoughtpost, "_call_openai", openai)
+    monkeypatch.setattr(thoughtpost, "_hf_generate", hf)
+    resp = client.post("/generate/thoughtpost/stream", json={"text": "hello"})
+    assert resp.text == "from hf"
+    assert len(opens) == 1
+    assert thoughtpost._oai_health["fails"] == 1
+
+
+def test_cleanup_hands_cp1252_mojibake_to_ftfy(monkeypatch):
+    fixed = {"itâ€™s great": "it’s great", "cafÃ© ðŸ¤” done": "café 🤔 done"}
+    seen = []
+
+    class FakeFtfy:
+        @staticmethod
+        def fix_encoding(s):
+            seen.append(s)
+            return fixed.get(s, s)
+
+    monkeypatch.setattr(thoughtpost, "ftfy", FakeFtfy)
+    for broken, good in fixed.items():
+        assert thoughtpost._cleanup(broken) == good
+    assert thoughtpost._cleanup("plain ascii text") == "plain ascii text"
+    assert seen == list(fixed)  # clean text never reaches ftfy
+
+
+def test_cleanup_without_ftfy_keeps_legitimate_accents(monkeypatch):
+    monkeypatch.setattr(thoughtpost, "ftfy", None)
+    assert thoughtpost._cleanup("Visite du château") == "Visite du château"
+
+
+def _batch_client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    return TestClient(app)
+
+
+def test_batch_sync_fan_out_is_bounded_on_every_loop(monkeypatch):
+    monkeypatch.setattr(thoughtpost, "OAI_CONCURRENCY", 2)
+    monkeypatch.setattr(thoughtpost, "_OAI_SEM", None)
+    state = {"active": 0, "peak": 0}
+
+    async def fake_generate(req):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        return {"draft": req.text}
+
+    monkeypatch.setattr(thoughtpost, "generate_thoughtpost", fake_generate)
+    client = _batch_client()
+    body = [{"text": f"t{i}"} for i in range(6)]
+    # without a lifespan every request runs on a fresh loop; the semaphore must follow it
+    for _ in range(2):
+        resp = client.post("/generate/thoughtpost/batch", json=body)
+        assert resp.status_code == 200
+        assert resp.json()["drafts"] == [{"draft": f"t{i}"} for i in range(6)]
+    assert state["peak"] == 2
+
+
+def test_batch_rejects_empty_and_oversized(monkeypatch):
+    monkeypatch.setattr(thoughtpost, "BATCH_MAX", 3)
+    client = _batch_client()
+    resp = client.post("/generate/thoughtpost/batch", json=[])
+    assert resp.status_code == 400
+    resp = client.post("/generate/thoughtpost/batch", json=[{"text": "x"}] * 4)
+    assert resp.status_code == 400
+    assert "max 3" in resp.json()["detail"]
+
+
+class _FakeBatches:
+    def __init__(self, batch):
+        self.batch = batch
+
+    async def retrieve(self, batch_id):
+        return self.batch
+
+
+class _FakeFiles:
+    def __init__(self, text):
+        self.text = text
+
+    async def content(self, file_id):
+        return type("Content", (), {"text": self.text})()
+
+
+def _batch_row(i, content):
+    body = {"choices": [{"message": {"content": content}}]}
+    return json.dumps({"custom_id": str(i), "response": {"body": body}})
+
+
+def test_batch_poll_returns_drafts_in_submission_order(monkeypatch):
+    from contextlib import asynccontextmanager
+    from types import SimpleNamespace
+
+    batch = SimpleNamespace(
+        id="b1", status="completed", output_file_id="f1",
+        request_counts=SimpleNamespace(total=3),
+    )
+    # output file rows arrive out of order and slot 1 failed outright
+    text = "\n".join([_batch_row(2, "third"), json.dumps({"custom_id": "1", "error": {}}), _batch_row(0, "first")])
+    fake = SimpleNamespace(batches=_FakeBatches(batch), files=_FakeFiles(text))
+
+    @asynccontextmanager
+    async def fake_client():
+        yield fake
+
+    monkeypatch.setattr(thoughtpost, "_oai_client", fake_client)
+    resp = _batch_client().get("/generate/thoughtpost/batch/b1")
+    assert resp.status_code == 200
+    assert resp.json()["drafts"] == [{"draft": "first"}, {"draft": ""}, {"draft": "third"}]
+
+
+def test_batch_poll_without_openai_client_is_502(monkeypatch):
+    from contextlib import asynccontextmanager
+
+    @asynccontextmanager
+    async def no_client():
+        raise RuntimeError("no OPENAI_API_KEY")
+        yield
+
+    monkeypatch.setattr(thoughtpost, "_oai_client", no_client)
+    resp = _batch_client().get("/generate/thoughtpost/batch/b1")
+    assert resp.status_code == 502